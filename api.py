@@ -0,0 +1,221 @@
+# Purpose: read-only HTTP API over the consumption data
+#
+# /api/subset selects rows the way data_subset does, from the same
+# per-dimension indexes, and /api/rollups/<name> returns the aggregates the
+# dashboard plots. /api/tables/<name>/subset does the same over the other
+# SEDS tables of seds_tables.REGISTRY. All are paginated with offset and
+# limit, and answer in columnar JSON or, with format=arrow and pyarrow
+# installed, as an Arrow IPC stream. Responses are cached as bytes per
+# dataset version and query.
+
+import hashlib
+import os
+
+import flask
+import numpy as np
+import pandas as pd
+
+import data_processing as dp
+import dataset_versions as dv
+import responses
+import rollups as ro
+import seds_tables
+import serialization
+
+DEFAULT_LIMIT = 10_000
+MAX_LIMIT = 100_000
+FORMATS = {"json": "application/json", "arrow": "application/vnd.apache.arrow.stream"}
+SUBSET_PARAMETERS = ["states", "years", "sectors", "sources"]
+
+ROLLUPS = {
+    "us-sources": lambda dataset: ro.consumption_rollup(dataset.primary_df).us_sources,
+    "us-totals": lambda dataset: ro.consumption_rollup(dataset.primary_df).us_totals,
+    "state-totals": lambda dataset: ro.consumption_rollup(dataset.primary_df).state_totals.frame,
+    "administrations": lambda dataset: ro.consumption_rollup(dataset.primary_df).administrations,
+    "us-per-capita": lambda dataset: ro.per_capita_rollup(dataset.df).us_per_capita,
+    "state-per-capita": lambda dataset: ro.per_capita_rollup(dataset.df).state_per_capita.frame,
+}
+
+API_CACHE = responses.ResponseCache(maxsize=int(os.environ.get("API_CACHE_SIZE", 256)))
+
+class QueryError(ValueError):
+    """A query the API cannot answer, reported to the client as 400"""
+
+def _int_parameter(name, default, minimum=0, maximum=None) -> int:
+    value = flask.request.args.get(name, default)
+    try:
+        value = int(value)
+    except ValueError:
+        raise QueryError(f"{name} must be an integer, not {value!r}")
+    if value < minimum or (maximum is not None and value > maximum):
+        bounds = f"at least {minimum}" if maximum is None else f"between {minimum} and {maximum}"
+        raise QueryError(f"{name} must be {bounds}")
+    return value
+
+def _page_columns(df, rows) -> dict:
+    """Return the columns of df at rows, categorical ones as (codes, categories)"""
+    columns = {}
+    for column in df.columns:
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            columns[column] = (series.cat.codes.to_numpy()[rows], series.cat.categories)
+        else:
+            columns[column] = series.to_numpy()[rows]
+    return columns
+
+def _json_body(columns, page) -> bytes:
+    decoded = {}
+    for column, values in columns.items():
+        if isinstance(values, tuple):
+            codes, categories = values
+            # Code -1, a missing value, picks the None appended last
+            values = np.append(np.asarray(categories, dtype=object), None)[codes].tolist()
+        elif values.dtype == object:
+            values = values.tolist()
+        decoded[column] = values
+    return serialization.dumps({**page, "columns": decoded})
+
+def _arrow_body(columns, page) -> bytes:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise QueryError("format=arrow needs pyarrow installed on the server")
+    arrays = {}
+    for column, values in columns.items():
+        if isinstance(values, tuple):
+            codes, categories = values
+            arrays[column] = pa.DictionaryArray.from_arrays(
+                pa.array(codes, mask=codes < 0), pa.array(np.asarray(categories, dtype=object)))
+        else:
+            arrays[column] = pa.array(values)
+    # The pagination travels in the schema, the stream has no other header
+    table = pa.table(arrays).replace_schema_metadata(
+        {key: "" if value is None else str(value) for key, value in page.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def _paginated(df, rows=None) -> tuple:
+    """Return the body of the requested page of df's rows and its mimetype"""
+    response_format = flask.request.args.get("format", "json")
+    if response_format not in FORMATS:
+        raise QueryError(f"format must be one of {list(FORMATS)}")
+    offset = _int_parameter("offset", 0)
+    # A page of no rows would never advance next_offset
+    limit = _int_parameter("limit", DEFAULT_LIMIT, minimum=1, maximum=MAX_LIMIT)
+
+    total = len(df) if rows is None else len(rows)
+    page_rows = np.arange(offset, min(offset + limit, total)) if rows is None \
+        else rows[offset:offset + limit]
+    page = {
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": offset + limit if offset + limit < total else None,
+    }
+    columns = _page_columns(df, page_rows)
+    if response_format == "arrow":
+        return _arrow_body(columns, page), FORMATS["arrow"]
+    return _json_body(columns, page), FORMATS["json"]
+
+def _cached(answer, dataset=None):
+    """Answer the current request with answer(dataset), cached by query
+
+    dataset is the active version unless given, anything with a key.
+    """
+    dataset = dataset or dv.current()
+    query = sorted(flask.request.args.items(multi=True))
+    key = hashlib.sha1(repr((dataset.key, flask.request.path, query)).encode()).digest()
+    cached = API_CACHE.get(key)
+    if cached is None:
+        cached = API_CACHE.put(key, *answer(dataset))
+    return API_CACHE.response(cached)
+
+api = flask.Blueprint("api", __name__, url_prefix="/api")
+
+@api.errorhandler(QueryError)
+def _query_error(error):
+    return flask.jsonify({"error": str(error)}), 400
+
+@api.route("/dimensions")
+def dimensions():
+    """Values the subset parameters accept"""
+    return _cached(lambda dataset: (
+        serialization.dumps(dp.subset_values(dataset.df)), FORMATS["json"]))
+
+def _selection() -> dict:
+    """Return the subset parameters of the request as data_subset arguments
+
+    Each parameter may be repeated and is ignored when absent.
+    """
+    unknown = set(flask.request.args) - set(SUBSET_PARAMETERS) - {"format", "offset", "limit"}
+    if unknown:
+        raise QueryError(f"unknown parameters {sorted(unknown)}")
+    selection = {name: flask.request.args.getlist(name) or None for name in SUBSET_PARAMETERS}
+    if selection["years"] is not None:
+        try:
+            selection["years"] = [int(year) for year in selection["years"]]
+        except ValueError:
+            raise QueryError("years must be integers")
+    return selection
+
+def _subset(selection, dataset=None):
+    def answer(dataset):
+        return _paginated(dataset.df, dp.subset_rows(dataset.df, **selection))
+    return _cached(answer, dataset)
+
+@api.route("/subset")
+def subset():
+    """Rows of the dataset, selected by states, years, sectors and sources"""
+    return _subset(_selection())
+
+@api.route("/rollups")
+def rollups():
+    """Names of the rollups"""
+    return flask.jsonify(sorted(ROLLUPS))
+
+@api.route("/rollups/<name>")
+def rollup(name):
+    """One of the aggregates the dashboard plots"""
+    if name not in ROLLUPS:
+        raise QueryError(f"rollup must be one of {sorted(ROLLUPS)}")
+    return _cached(lambda dataset: _paginated(ROLLUPS[name](dataset)))
+
+def _table(name) -> seds_tables.LoadedTable:
+    try:
+        return seds_tables.REGISTRY.get(name)
+    except KeyError:
+        raise QueryError(f"table must be one of {sorted(seds_tables.TABLES)}")
+    except FileNotFoundError:
+        raise QueryError(f"the {name} table is not in the data directory")
+
+@api.route("/tables")
+def tables():
+    """The other SEDS tables, whether their file is there and the registry"""
+    available = seds_tables.REGISTRY.available()
+    return flask.jsonify({
+        "tables": {
+            name: {"description": table.description, "available": name in available}
+            for name, table in seds_tables.TABLES.items()
+        },
+        "registry": seds_tables.REGISTRY.stats(),
+    })
+
+@api.route("/tables/<name>/dimensions")
+def table_dimensions(name):
+    return _cached(lambda table: (
+        serialization.dumps(dp.subset_values(table.df)), FORMATS["json"]), _table(name))
+
+@api.route("/tables/<name>/subset")
+def table_subset(name):
+    """Rows of one of the other SEDS tables, selected like /subset"""
+    return _subset(_selection(), _table(name))
+
+@api.route("/cache")
+def cache_stats():
+    return flask.jsonify(API_CACHE.stats())
+
+def init_app(app) -> None:
+    """Serve the API from the Dash app's server"""
+    app.server.register_blueprint(api)
@@ -2,22 +2,32 @@
 # Date: 02/03/2021
 # Purpose: US energy consumption app
 
-import json
+import functools
 import os
+import threading
 
 import dash
-import dash_table
+import flask
 import dash_core_components as dcc
 import dash_html_components as html
-from dash.dependencies import Input, Output
-import plotly.express as px
-import plotly
+from dash.dependencies import Input, Output, State
+from dash.exceptions import PreventUpdate
 import pandas as pd
 
-import data_processing as dp
+import api
+import dataset_versions as dv
 import plot_computations as pc
+import figure_cache as fc
+import figure_store as fs
+import geography as geo
 import plotting
+import prerender
 import markdown
+import metrics
+import responses
+import rollups as ro
+import shared_dataset as sd
+import warmup
 
 DEBUG = True
 
@@ -26,184 +36,409 @@ external_stylesheets = ['https://maxcdn.bootstrapcdn.com/bootstrap/4.0.0/css/boo
 app = dash.Dash(__name__, external_stylesheets=external_stylesheets)
 
 server = app.server
+metrics.init_app(app)
 
-df = dp.load_dataset()
-primary_energy_df = dp.load_primary_energy_sources(df)
-with open(os.path.join("data", "united_states.geojson")) as infile:
-    united_states_geojson = json.load(infile)
-
-# Precomputed figures
-# us_main_plot_dict = pc.precompute_main_plots(df, primary_energy_df)
-# state_total_dict = pc.precompute_state_per_year(df)
-
-app.layout = html.Div(children = [
-    # html.Div(
-    #     children=[
-    #         html.Div(
-    #             dcc.Graph(
-    #                 id="choropleth",
-    #                 figure=pc.update_choropleth(df, united_states_geojson)
-    #             ),
-    #         ),
-    #         dcc.Dropdown(
-    #             id='year-slider',
-    #             options=[{"value": year, "label": str(year)} for year in df["Year"].unique()],
-    #             value=2018,
-    #             style={"width" : "100px", "margin-left": "30px"}
-    #         ),
-    #     ]
-    # ),
-    html.Div(
-        children = [
-            html.H1("United States Energy Consumption", style={"font-size": "3.0vw", "text-align": "center"}),
-            dcc.Markdown(markdown.INTRO, id="intro-text"),
-            html.Hr(),
-            html.Div(
-                children = [
-                    html.Div(
+# Workers can map one shared copy of the data instead of each holding their own
+if os.environ.get("SHARED_DATASET"):
+    dataset = dv.from_frames(*sd.load_shared(on_rows=dv.cache_digests))
+else:
+    dataset = dv.load(categorical=True)
+ro.build_rollups(dataset.df, dataset.primary_df)
+dv.activate(dataset)
+
+figure_cache = fc.FIGURE_CACHE
+
+def size_figure_cache(dataset):
+    """Fit every figure of dataset in the cache, unless FIGURE_CACHE_SIZE is set"""
+    if not fc.FIGURE_CACHE_SIZE:
+        figure_cache.resize(
+            sum(1 for _ in prerender.reachable_figures(dataset.df, dataset.primary_df)))
+
+size_figure_cache(dataset)
+# Built by prerender.py, ignored if the dataset has changed since
+figure_store = fs.open_store(dataset.key)
+
+# Repeat callback requests are answered from cached, compressed bytes
+responses.init_app(app, version=lambda: dv.current().key)
+# Read-only queries for analysts, under /api
+api.init_app(app)
+
+def render_figure(dataset, build, *args):
+    """Return build(*args) from the pre-rendered store or the figure cache"""
+    store = figure_store
+    if store is not None and store.dataset_key == dataset.key:
+        key = fs.figure_key(build, *args)
+        if key in store:
+            return store.get(key)
+    return figure_cache.get(build, *args)
+
+@server.route("/figure-cache")
+def figure_cache_stats():
+    return flask.jsonify(figure_cache.stats())
+
+def warm_figure(build, *args):
+    if figure_store is None or fs.figure_key(build, *args) not in figure_store:
+        figure_cache.get_json(build, *args)
+
+def start_warmup(dataset):
+    """Render the likeliest figures of dataset in the background"""
+    if not warmup_workers:
+        return None
+    return warmup.Warmup(
+        warmup.figure_jobs(dataset.df, dataset.primary_df, dataset.years, dataset.years[-1]),
+        warm_figure, warmup_workers
+    ).start()
+
+# Render the likeliest figures in the background, the default view first
+warmup_workers = int(os.environ.get("WARMUP_WORKERS", warmup.DEFAULT_WORKERS))
+figure_warmup = None
+
+@dv.on_swap
+def dataset_swapped(previous, dataset):
+    """Point the caches at a refreshed dataset"""
+    global figure_store, figure_warmup
+    figure_store = fs.open_store(dataset.key)
+    size_figure_cache(dataset)
+    # In-flight requests may still read the previous frames, but their
+    # figures are dropped now rather than when the frames are collected
+    for frame in (previous.df, previous.primary_df):
+        if frame is not dataset.df and frame is not dataset.primary_df:
+            figure_cache.invalidate(fc.frame_token(frame))
+    responses.RESPONSE_CACHE.clear()
+    api.API_CACHE.clear()
+    if figure_warmup is not None:
+        figure_warmup.stop()
+    figure_warmup = start_warmup(dataset)
+
+# Pick up new SEDS vintages without restarting the workers
+refresh_seconds = float(os.environ.get("DATASET_REFRESH_SECONDS", 0))
+
+def start_background_work():
+    """Start the warm-up and the dataset watcher of this process
+
+    Threads do not survive a fork, so when gunicorn preloads the app each
+    worker starts its own from gunicorn.conf.py instead.
+    """
+    def warm():
+        global figure_warmup
+        # The browser asks for the layout before any figure
+        dataset_layout(dv.current())
+        figure_warmup = start_warmup(dv.current())
+    threading.Thread(target=warm, name="warmup", daemon=True).start()
+    if refresh_seconds:
+        dv.watch(refresh_seconds)
+
+def preload():
+    """Build once in the gunicorn master what every worker would build
+
+    The forked workers share the figure templates, the default view and the
+    page layout with the master, copy-on-write.
+    """
+    dataset = dv.current()
+    pc.build_templates()
+    for priority, build, args in warmup.figure_jobs(
+            dataset.df, dataset.primary_df, dataset.years, dataset.years[-1]):
+        if priority == 0:
+            warm_figure(build, *args)
+    dataset_layout(dataset)
+
+@server.route("/dataset")
+def dataset_info():
+    dataset = dv.current()
+    return flask.jsonify({
+        "key": dataset.key,
+        "first_year": dataset.years[0],
+        "last_year": dataset.years[-1],
+        "rows": len(dataset.df),
+    })
+
+@server.route("/warmup")
+def warmup_progress():
+    if figure_warmup is None:
+        return flask.jsonify({"enabled": False})
+    return flask.jsonify(figure_warmup.progress())
+
+def administration_table(administrations):
+    """Return the per-administration aggregates as an HTML table"""
+    sources = list(administrations.columns[administrations.columns.get_loc("Growth") + 1:])
+    header = ["President", "Years", "Average (Quadrillion BTU)", "Growth per year"] + sources
+    rows = []
+    for _, row in administrations.iterrows():
+        first_year = int(row["Start"])
+        last_year = first_year + int(row["Years"]) - 1
+        cells = [
+            row["President"],
+            f"{first_year}-{last_year}" if last_year > first_year else str(first_year),
+            f"{row['Average']:.3f}",
+            "-" if pd.isna(row["Growth"]) else f"{row['Growth']:+.1%}"
+        ] + [f"{row[source]:.1%}" for source in sources]
+        rows.append(html.Tr(
+            [html.Td(cell) for cell in cells],
+            style={"background-color": plotting.PRESIDENTIAL_PARTY_COLORS[row["Party"]]}
+        ))
+    return html.Table(
+        [html.Thead(html.Tr([html.Th(cell) for cell in header])), html.Tbody(rows)],
+        className="table table-sm"
+    )
+
+def page_layout(dataset, choropleth=None):
+    """Return the page layout of dataset around the choropleth figure"""
+    years = dataset.years
+    states = ro.consumption_rollup(dataset.primary_df).state_totals.states
+    return html.Div(children = [
+        html.Div(
+            children = [
+                html.H1("United States Energy Consumption", style={"font-size": "3.0vw", "text-align": "center"}),
+                dcc.Markdown(markdown.INTRO, id="intro-text"),
+                html.Hr(),
+                html.Div(
+                    children = [
                         html.Div(
-                            children=[
-                                html.Div(
-                                    children = [
-                                        html.H3(
-                                            id="main-plot-header",
-                                            className="plot-header"
-                                        ),
-                                        dcc.Dropdown(
-                                            options=[
-                                                {'label': 'Energy consumption',
-                                                    'value': 'Energy consumption'},
-                                                {'label': 'Energy consumption (per capita)',
-                                                    'value': 'Energy consumption (per capita)'},
-                                                {'label': 'Energy consumption (per resource)',
-                                                    'value': 'Energy consumption (per resource)'},
-                                                {'label': 'Resource consumption',
-                                                    'value': 'Resource consumption'},
-                                            ],
-                                            value='Energy consumption',
-                                            className="plot-type-dropdown",
-                                            id="main-plot-type",
-                                            clearable=False
-                                        ),
-                                        dcc.Dropdown(
-                                            options=[
-                                                {'label': 'Year',
-                                                    'value': 'Year'},
-                                                {'label': 'President',
-                                                    'value': 'President'},
-                                            ],
-                                            value='Year',
-                                            id="x-axis-labels",
-                                            clearable=False
-                                        )
-                                    ],
-                                    className="row"
-                                ),
-                                dcc.Graph(
-                                    id="us-total",
-                                    clickData={"points": [{"x": "2018-01-01"}]},
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                )
-                            ],
-                            className="plot"
+                            html.Div(
+                                children=[
+                                    html.Div(
+                                        children = [
+                                            html.H3(
+                                                id="main-plot-header",
+                                                className="plot-header"
+                                            ),
+                                            dcc.Dropdown(
+                                                options=[
+                                                    {'label': 'Energy consumption',
+                                                        'value': 'Energy consumption'},
+                                                    {'label': 'Energy consumption (per capita)',
+                                                        'value': 'Energy consumption (per capita)'},
+                                                    {'label': 'Energy consumption (per resource)',
+                                                        'value': 'Energy consumption (per resource)'},
+                                                    {'label': 'Resource consumption',
+                                                        'value': 'Resource consumption'},
+                                                ],
+                                                value='Energy consumption',
+                                                className="plot-type-dropdown",
+                                                id="main-plot-type",
+                                                clearable=False
+                                            ),
+                                            dcc.Dropdown(
+                                                options=[
+                                                    {'label': 'Year',
+                                                        'value': 'Year'},
+                                                    {'label': 'President',
+                                                        'value': 'President'},
+                                                ],
+                                                value='Year',
+                                                id="x-axis-labels",
+                                                clearable=False
+                                            )
+                                        ],
+                                        className="row"
+                                    ),
+                                    dcc.Graph(
+                                        id="us-total",
+                                        clickData={"points": [{"x": f"{years[-1]}-01-01"}]},
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-8"
                         ),
-                        className="col-xl-8"
-                    ),
-                    html.Div(
                         html.Div(
-                            children=[
-                                html.H3(
-                                    id="us-primary-header",
-                                    className="plot-header"
-                                ),
-                                dcc.Graph(
-                                    id="us-primary-bar",
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                )
-                            ],
-                            className="plot"
+                            html.Div(
+                                children=[
+                                    html.H3(
+                                        id="us-primary-header",
+                                        className="plot-header"
+                                    ),
+                                    dcc.Graph(
+                                        id="us-primary-bar",
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-4"
                         ),
-                        className="col-xl-4"
-                    ),
-                ],
-                className="row"
-            ),
-            html.Div(
-                children = [
-                    html.Div(
+                    ],
+                    className="row"
+                ),
+                html.Div(
+                    children = [
                         html.Div(
-                            children=[
-                                html.H3(
-                                    id="us-pie-header",
-                                    className="plot-header"
-                                ),
-                                dcc.Graph(
-                                    id="us-primary-pie",
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                )
-                            ],
-                            className="plot"
+                            html.Div(
+                                children=[
+                                    html.H3(
+                                        id="us-pie-header",
+                                        className="plot-header"
+                                    ),
+                                    dcc.Graph(
+                                        id="us-primary-pie",
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-4"
                         ),
-                        className="col-xl-4"
-                    ),
-                    html.Div(
                         html.Div(
-                            children=[
-                                html.Div(
-                                    children=[
-                                        html.H3(
-                                            id="state-plot-header",
-                                            className="plot-header"
-                                        ),
-                                        dcc.Dropdown(
-                                            options=[
-                                                {'label': 'Energy consumption',
-                                                    'value': 'Energy consumption'},
-                                                {'label': 'Energy consumption (per capita)',
-                                                    'value': 'Energy consumption (per capita)'},
-                                            ],
-                                            value='Energy consumption',
-                                            className="plot-type-dropdown",
-                                            id="state-plot-type",
-                                            clearable=False
-                                        ),
-                                    ],
-                                    className="row"
-                                ),
-                                dcc.Graph(
-                                    id="state-total-bar",
-                                    style={"height": plotting.PLOT_HEIGHT}
-                                )
-                            ],
-                            className="plot"
+                            html.Div(
+                                children=[
+                                    html.Div(
+                                        children=[
+                                            html.H3(
+                                                id="state-plot-header",
+                                                className="plot-header"
+                                            ),
+                                            dcc.Dropdown(
+                                                options=[
+                                                    {'label': 'Energy consumption',
+                                                        'value': 'Energy consumption'},
+                                                    {'label': 'Energy consumption (per capita)',
+                                                        'value': 'Energy consumption (per capita)'},
+                                                ],
+                                                value='Energy consumption',
+                                                className="plot-type-dropdown",
+                                                id="state-plot-type",
+                                                clearable=False
+                                            ),
+                                        ],
+                                        className="row"
+                                    ),
+                                    dcc.Graph(
+                                        id="state-total-bar",
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-8"
                         ),
-                        className="col-xl-8"
-                    ),
-                ],
-                className="row"
-            ),
-        ],
-        className="container-fluid dash"
-    )
-])
+                    ],
+                    className="row"
+                ),
+                html.Div(
+                    children = [
+                        html.Div(
+                            html.Div(
+                                children=[
+                                    html.Div(
+                                        children=[
+                                            html.H3(
+                                                id="state-history-header",
+                                                className="plot-header"
+                                            ),
+                                            dcc.Dropdown(
+                                                options=[{"label": state, "value": state} for state in states],
+                                                value=states[0],
+                                                className="plot-type-dropdown",
+                                                id="state-history-state",
+                                                clearable=False
+                                            ),
+                                            dcc.Dropdown(
+                                                options=[{"label": depiction, "value": depiction}
+                                                         for depiction in pc.HISTORY_DEPICTIONS],
+                                                value=pc.HISTORY_DEPICTIONS[0],
+                                                className="plot-type-dropdown",
+                                                id="state-history-type",
+                                                clearable=False
+                                            ),
+                                        ],
+                                        className="row"
+                                    ),
+                                    dcc.Graph(
+                                        id="state-history",
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    )
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-12"
+                        ),
+                    ],
+                    className="row"
+                ),
+                html.Div(
+                    children = [
+                        html.Div(
+                            html.Div(
+                                children=[
+                                    html.H3(
+                                        "Energy consumption by administration",
+                                        className="plot-header"
+                                    ),
+                                    # Aggregated once per dataset by rollups
+                                    administration_table(
+                                        ro.consumption_rollup(dataset.primary_df).administrations)
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-12"
+                        ),
+                    ],
+                    className="row"
+                ),
+                html.Div(
+                    children = [
+                        html.Div(
+                            html.Div(
+                                children=[
+                                    html.Div(
+                                        children=[
+                                            html.H3(
+                                                "Energy consumption (per capita)",
+                                                className="plot-header"
+                                            ),
+                                            dcc.Dropdown(
+                                                id='year-slider',
+                                                options=[{"value": year, "label": str(year)} for year in years],
+                                                value=years[-1],
+                                                clearable=False,
+                                                style={"width" : "100px", "margin-left": "30px"}
+                                            ),
+                                        ],
+                                        className="row"
+                                    ),
+                                    dcc.Graph(
+                                        id="choropleth",
+                                        figure=choropleth,
+                                        style={"height": plotting.PLOT_HEIGHT}
+                                    ),
+                                    dcc.Store(id="choropleth-values")
+                                ],
+                                className="plot"
+                            ),
+                            className="col-xl-12"
+                        ),
+                    ],
+                    className="row"
+                ),
+            ],
+            className="container-fluid dash"
+        )
+    ])
 
-########## HEADERS
+_layout_lock = threading.Lock()
 
-@app.callback(
-    Output('us-primary-header', 'children'),
-    Input('us-total', 'clickData')
-)
-def us_primary_bar_header(clickData):
-    year_value = int(clickData['points'][0]['x'][:4])
-    return f"Resource usage ({year_value})"
+def dataset_layout(dataset):
+    """Return the page layout of dataset, built once per version"""
+    # Requests arriving during the warm-up wait for its layout
+    with _layout_lock:
+        return _dataset_layout(dataset)
 
-@app.callback(
-    Output('us-pie-header', 'children'),
-    Input('us-total', 'clickData')
-)
-def us_primary_pie_header(clickData):
-    year_value = int(clickData['points'][0]['x'][:4])
-    return f"Resource % ({year_value})"
+@functools.lru_cache(maxsize=1)
+def _dataset_layout(dataset):
+    # Only the active year is sent with the page, later years arrive as
+    # choropleth-values
+    return page_layout(dataset, pc.choropleth_per_year(
+        dataset.df, geo.geojson_for_zoom(plotting.MAPBOX_ZOOM), dataset.years[-1]))
+
+# Dash validates the callbacks against the result of a layout function when
+# it is assigned, unless given this. Without the choropleth it spares the
+# import the first plotly express figure costs.
+app.validation_layout = page_layout(dataset)
+# Served per page load, so a refreshed dataset shows up on the next visit
+app.layout = lambda: dataset_layout(dv.current())
+
+########## HEADERS
 
 @app.callback(
     Output('main-plot-header', 'children'),
@@ -212,15 +447,6 @@ def us_primary_pie_header(clickData):
 def update_main_plot_header(main_plot_type):
     return main_plot_type
 
-@app.callback(
-    Output('state-plot-header', 'children'),
-    [Input("state-plot-type", "value"),
-     Input('us-total', 'clickData')]
-)
-def update_state_plot_header(main_plot_type, clickData):
-    year_value = int(clickData['points'][0]['x'][:4])
-    return f"{main_plot_type} ({year_value})"
-
 ########## MAIN PLOT
 @app.callback(
     Output('us-total', 'figure'),
@@ -228,44 +454,107 @@ def update_state_plot_header(main_plot_type, clickData):
     Input("x-axis-labels", "value")]
 )
 def update_main_plot(depiction_type, x_axis_type):
-    # fig_key = depiction_type + x_axis_type
-    fig = pc.precompute_main_plots(df, primary_energy_df, depiction_type, x_axis_type)
-    # fig = us_main_plot_dict[fig_key]
+    dataset = dv.current()
+    fig = render_figure(dataset, pc.precompute_main_plots,
+                        dataset.df, dataset.primary_df, depiction_type, x_axis_type)
     return fig
 
-########## PIE CHART
+########## YEAR SELECTION
 
+# Every plot that depends on the clicked year is updated by one request
 @app.callback(
-    Output('us-primary-pie', 'figure'),
-    Input('us-total', 'clickData')
+    [Output('us-primary-header', 'children'),
+     Output('us-pie-header', 'children'),
+     Output('us-primary-bar', 'figure'),
+     Output('us-primary-pie', 'figure'),
+     Output('state-plot-header', 'children'),
+     Output('state-total-bar', 'figure')],
+    [Input('state-plot-type', 'value'),
+     Input('us-total', 'clickData')]
 )
-def us_primary_pie(clickData):
+def update_year_selection(state_plot_type, clickData):
     year_value = int(clickData['points'][0]['x'][:4])
-    fig = pc.pie_plot_per_year(primary_energy_df, year_value)
-    return fig
+    # Read once so that every figure comes from the same dataset version
+    dataset = dv.current()
+
+    state_header = f"{state_plot_type} ({year_value})"
+    state_fig = render_figure(dataset, pc.precompute_state_per_year,
+                              dataset.df, dataset.primary_df, state_plot_type, year_value)
 
-########## BAR PLOT
+    # Switching the state depiction leaves the US plots as they are
+    triggered = [trigger["prop_id"] for trigger in dash.callback_context.triggered]
+    if triggered == ["state-plot-type.value"]:
+        return (dash.no_update,)*4 + (state_header, state_fig)
 
+    return (
+        f"Resource usage ({year_value})",
+        f"Resource % ({year_value})",
+        render_figure(dataset, pc.us_primary_per_year, dataset.primary_df, year_value),
+        render_figure(dataset, pc.pie_plot_per_year, dataset.primary_df, year_value),
+        state_header,
+        state_fig
+    )
+
+########## STATE HISTORY
+
+# Clicking a state's bar shows its history
 @app.callback(
-    Output('us-primary-bar', 'figure'),
-    Input('us-total', 'clickData')
+    Output('state-history-state', 'value'),
+    Input('state-total-bar', 'clickData'),
+    prevent_initial_call=True
 )
-def us_primary_bar(clickData):
-    year_value = int(clickData['points'][0]['x'][:4])
-    fig = pc.us_primary_per_year(primary_energy_df, year_value)
-    return fig
+def select_history_state(clickData):
+    return clickData['points'][0]['x']
 
 @app.callback(
-    Output('state-total-bar', 'figure'),
-    [Input('state-plot-type', 'value'),
-    Input('us-total', 'clickData')]
+    [Output('state-history-header', 'children'),
+     Output('state-history', 'figure')],
+    [Input('state-history-state', 'value'),
+     Input('state-history-type', 'value'),
+     Input('x-axis-labels', 'value')]
 )
-def update_state_bar_plot(state_plot_type, clickData):
-    year_value = int(clickData['points'][0]['x'][:4])
-    # dict_key = state_plot_type + str(year_value)
-    # fig = state_total_dict[dict_key]
-    fig = pc.precompute_state_per_year(df, primary_energy_df, state_plot_type, year_value)
-    return fig
+def update_state_history(state, depiction_type, x_axis_type):
+    dataset = dv.current()
+    # A page opened before a refresh may still show a state the new
+    # dataset doesn't have
+    if state not in ro.state_history_rollup(dataset.primary_df):
+        raise PreventUpdate
+    fig = render_figure(dataset, pc.state_history,
+                        dataset.df, dataset.primary_df, state, depiction_type, x_axis_type)
+    return f"{state}: {depiction_type}", fig
+
+########## CHOROPLETH
+
+@app.callback(
+    Output('choropleth-values', 'data'),
+    Input('year-slider', 'value'),
+    prevent_initial_call=True
+)
+def update_choropleth_values(year_value):
+    return pc.choropleth_values(dv.current().df, year_value)
+
+# Patch the new year's colors into the figure already in the browser instead
+# of sending the geometry again
+app.clientside_callback(
+    """
+    function(values, figure) {
+        if (!values || !figure) {
+            return window.dash_clientside.no_update;
+        }
+        const trace = Object.assign({}, figure.data[0], values);
+        return Object.assign({}, figure, {data: [trace]});
+    }
+    """,
+    Output('choropleth', 'figure'),
+    Input('choropleth-values', 'data'),
+    State('choropleth', 'figure')
+)
+
+# Set by gunicorn.conf.py, whose master imports the app once before forking
+if os.environ.get("APP_PRELOAD"):
+    preload()
+else:
+    start_background_work()
 
 if __name__ == '__main__':
     app.run_server(debug=DEBUG)
@@ -0,0 +1,68 @@
+# Purpose: compare choropleth payloads built from each GeoJSON variant
+# Usage: python -m benchmarks.choropleth_size
+#
+# Parse time is measured with JSON.parse in node when it is installed, since
+# it runs the same V8 engine as Chrome, and with Python's json otherwise.
+
+import gzip
+import json
+import shutil
+import subprocess
+import tempfile
+import time
+
+import plotly.io as pio
+
+import data_processing as dp
+import geography as geo
+import plot_computations as pc
+import plotting
+
+REPEAT = 5
+
+NODE_PARSE = """
+const text = require("fs").readFileSync(process.argv[1], "utf8");
+let best = Infinity;
+for (let i = 0; i < Number(process.argv[2]); i++) {
+    const start = process.hrtime.bigint();
+    JSON.parse(text);
+    best = Math.min(best, Number(process.hrtime.bigint() - start)/1e6);
+}
+console.log(best);
+"""
+
+def parse_ms(figure_json) -> float:
+    """Return the best of REPEAT parse times of figure_json in milliseconds"""
+    node = shutil.which("node")
+    if node is None:
+        best = float("inf")
+        for _ in range(REPEAT):
+            start = time.perf_counter()
+            json.loads(figure_json)
+            best = min(best, (time.perf_counter() - start)*1000)
+        return best
+
+    with tempfile.NamedTemporaryFile("w", suffix=".json") as outfile:
+        outfile.write(figure_json)
+        outfile.flush()
+        output = subprocess.run(
+            [node, "-e", NODE_PARSE, outfile.name, str(REPEAT)],
+            capture_output=True, text=True, check=True
+        ).stdout
+    return float(output)
+
+def main():
+    df, _ = dp.load_datasets(categorical=True)
+    print(f"Zoom {plotting.MAPBOX_ZOOM} serves {geo.variant_for_zoom(plotting.MAPBOX_ZOOM)!r}")
+    print(f"{'Variant':<10}{'GeoJSON (kB)':>14}{'Figure (kB)':>14}{'Gzipped (kB)':>14}{'Parse (ms)':>12}")
+    for variant in [None, *geo.GEOJSON_VARIANTS]:
+        geojson = geo.load_geojson(variant)
+        figure_json = pio.to_json(pc.update_choropleth(df, geojson), validate=False)
+        print(
+            f"{variant or 'full':<10}{len(json.dumps(geojson))/1000:>14.0f}"
+            f"{len(figure_json)/1000:>14.0f}{len(gzip.compress(figure_json.encode()))/1000:>14.0f}"
+            f"{parse_ms(figure_json):>12.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
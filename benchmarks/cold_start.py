@@ -0,0 +1,99 @@
+# Purpose: report the import time and time to first response of a worker
+# Usage: python -m benchmarks.cold_start [--runs 3] [--top 12]
+#
+# Every run starts a fresh interpreter. "boot" imports app.py the way a
+# worker without preloading does, "fork" imports it the way the gunicorn
+# master of gunicorn.conf.py does and times a worker forked from it. Times
+# count from the start of the interpreter, or from the fork.
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+WORKER = r"""
+import gc, json, os, sys, time
+
+spawned = float(sys.argv[1])
+timings = {}
+import app
+from benchmarks.run import _callback_request
+timings["import"] = time.time() - spawned
+
+if os.environ.get("APP_PRELOAD"):
+    gc.freeze()
+    spawned = time.time()
+    if os.fork():
+        os.wait()
+        sys.exit(0)
+    app.start_background_work()
+
+client = app.server.test_client()
+for name, request in [
+    ("page", lambda: client.get("/")),
+    ("layout", lambda: client.get("/_dash-layout")),
+    ("figure", lambda: client.post("/_dash-update-component", json=_callback_request(
+        [("us-total", "figure")],
+        [("main-plot-type", "value", "Energy consumption"), ("x-axis-labels", "value", "Year")]))),
+]:
+    assert request().status_code == 200
+    timings[name] = time.time() - spawned
+print(json.dumps(timings), flush=True)
+os._exit(0)
+"""
+
+MODES = {"boot": {}, "fork": {"APP_PRELOAD": "1"}}
+
+def time_worker(mode) -> dict:
+    env = dict(os.environ, **MODES[mode])
+    output = subprocess.run(
+        [sys.executable, "-c", WORKER, str(time.time())],
+        env=env, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def import_times(top) -> list:
+    """Return (module, seconds) for app.py and its slowest direct imports"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        env=dict(os.environ, WARMUP_WORKERS="0"), capture_output=True, text=True, check=True
+    ).stderr
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1)//2
+        modules.append((depth, name.strip(), int(cumulative)/1e6))
+    app_seconds = next(seconds for depth, name, seconds in modules
+                       if depth == 0 and name == "app")
+    direct = sorted(((name, seconds) for depth, name, seconds in modules if depth == 1),
+                    key=lambda item: -item[1])
+    return [("app", app_seconds)] + direct[:top]
+
+def main():
+    parser = argparse.ArgumentParser(description="Report worker cold start times")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=12)
+    args = parser.parse_args()
+
+    print(f"{'Import':<40}{'Cumulative (s)':>15}")
+    for name, seconds in import_times(args.top):
+        print(f"{name:<40}{seconds:>15.3f}")
+
+    print()
+    print(f"{'Mode':<10}{'Import (s)':>12}{'Page (s)':>12}{'Layout (s)':>12}{'Figure (s)':>12}")
+    for mode in MODES:
+        runs = [time_worker(mode) for _ in range(args.runs)]
+        medians = {name: statistics.median(run[name] for run in runs) for name in runs[0]}
+        print(f"{mode:<10}{medians['import']:>12.3f}{medians['page']:>12.3f}"
+              f"{medians['layout']:>12.3f}{medians['figure']:>12.3f}")
+    print("Fork times after Import count from the fork of the preloaded master")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# Purpose: compare building figures from templates with plotly express
+# Usage: python -m benchmarks.figure_templates [--repeat 20] [--data DIR]
+
+import argparse
+import json
+
+import plotly.io as pio
+
+import data_processing as dp
+import plot_computations as pc
+import rollups as ro
+from benchmarks.run import Benchmark
+
+def _same_figure(a, b) -> bool:
+    def normalized(fig):
+        # Round trip through JSON so that arrays and lists compare equal
+        return json.loads(pio.to_json(fig, validate=False))
+    return normalized(a) == normalized(b)
+
+def cases(df, primary_df, year) -> list:
+    """Return (name, template build, plotly express build) to compare"""
+    consumption = ro.consumption_rollup(primary_df)
+    max_sources = consumption.us_sources_max + consumption.us_sources_max*.05
+    year_sources = consumption.us_sources_for(year)
+    state_totals = consumption.state_totals
+    state_per_capita = ro.per_capita_rollup(df).state_per_capita
+
+    comparisons = []
+    for depiction in pc.MAIN_DEPICTIONS:
+        for x_axis in pc.X_AXIS_TYPES:
+            comparisons.append((
+                f"us_total[{depiction}, {x_axis}]",
+                lambda depiction=depiction, x_axis=x_axis: pc.us_total(df, primary_df, depiction, x_axis),
+                lambda depiction=depiction, x_axis=x_axis: pc.us_total_px(df, primary_df, depiction, x_axis),
+            ))
+    comparisons += [
+        ("us_primary_per_year",
+         lambda: pc.us_primary_per_year(primary_df, year),
+         lambda: pc.source_bar_plot_px(year_sources, max_sources)),
+        ("pie_plot_per_year",
+         lambda: pc.pie_plot_per_year(primary_df, year),
+         lambda: pc.source_pie_plot_px(year_sources)),
+        ("state_bar_plot",
+         lambda: pc.state_bar_plot(state_totals.for_year(year), state_totals.max_value),
+         lambda: pc.state_bar_plot_px(state_totals.for_year(year), state_totals.max_value)),
+        ("state_per_cap_bar_plot",
+         lambda: pc.state_per_cap_bar_plot(state_per_capita.for_year(year), state_per_capita.max_value),
+         lambda: pc.state_per_cap_bar_plot_px(state_per_capita.for_year(year), state_per_capita.max_value)),
+    ]
+    return comparisons
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare template and plotly express figure builds")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--data", help="data directory written by benchmarks.synthetic_seds")
+    args = parser.parse_args()
+    if args.data:
+        dp.set_data_dir(args.data)
+
+    df, primary_df = dp.load_datasets(categorical=True)
+    ro.build_rollups(df, primary_df)
+    year = int(df["Year"].max())
+
+    print(f"{'Figure':<58}{'px (ms)':>10}{'Template (ms)':>15}{'Speedup':>9}{'Same':>6}")
+    for name, template_build, px_build in cases(df, primary_df, year):
+        px_time = Benchmark(name, px_build, repeat=args.repeat).run()["median"]
+        template_time = Benchmark(name, template_build, repeat=args.repeat).run()["median"]
+        same = _same_figure(template_build(), px_build())
+        print(f"{name:<58}{px_time*1000:>10.2f}{template_time*1000:>15.3f}"
+              f"{px_time/template_time:>9.0f}x{str(same):>6}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+# Purpose: report peak resident memory of whole-file and chunked ingestion
+# Usage: python -m benchmarks.ingest_memory [--fpath data/use_all_btu.csv]
+#
+# Each load runs in a fresh process so that its peak RSS is its own.
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+import data_processing as dp
+
+CHUNKSIZES = [None, 20_000, 5_000, 1_000]
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is in kB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss/1024
+
+def _load(fpath, chunksize, categorical, results) -> None:
+    start_rss = _peak_rss_mb()
+    start = time.perf_counter()
+    df = dp.load_dataset(categorical=categorical, chunksize=chunksize, fpath=fpath)
+    results.put((time.perf_counter() - start, start_rss, _peak_rss_mb(), len(df)))
+
+def measure(fpath, chunksize, categorical) -> tuple:
+    """Return (seconds, RSS before loading, peak RSS, rows) in a new process"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_load, args=(fpath, chunksize, categorical, results))
+    process.start()
+    result = results.get()
+    process.join()
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure ingestion peak memory")
+    parser.add_argument("--fpath", default=dp.SEDS_PATH)
+    args = parser.parse_args()
+
+    print(f"{'Chunk size':<12}{'Categorical':>12}{'Time (s)':>10}{'Base RSS (MB)':>15}{'Peak RSS (MB)':>15}{'Rows':>12}")
+    for categorical in [False, True]:
+        for chunksize in CHUNKSIZES:
+            seconds, start_rss, peak_rss, rows = measure(args.fpath, chunksize, categorical)
+            print(
+                f"{str(chunksize or 'whole file'):<12}{str(categorical):>12}{seconds:>10.2f}"
+                f"{start_rss:>15.1f}{peak_rss:>15.1f}{rows:>12}"
+            )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+# Purpose: report the in-memory size of each load_dataset variant
+# Usage: python -m benchmarks.memory_footprint
+
+import gc
+
+import data_processing as dp
+
+VARIANTS = {
+    "default": dict(),
+    "categorical": dict(categorical=True),
+    "categorical + downcast": dict(categorical=True, downcast=True),
+}
+
+def measure_variants() -> dict:
+    """Return {variant: (dataset bytes, primary sources bytes)}"""
+    footprints = {}
+    for name, options in VARIANTS.items():
+        df = dp.load_dataset(**options)
+        primary_df = dp.load_primary_energy_sources(df, **options)
+        footprints[name] = (dp.memory_footprint(df), dp.memory_footprint(primary_df))
+        del df, primary_df
+        gc.collect()
+    return footprints
+
+def main():
+    footprints = measure_variants()
+    print(f"{'Variant':<25}{'Dataset (MB)':>15}{'Primary (MB)':>15}{'Total (MB)':>15}")
+    for name, (dataset_bytes, primary_bytes) in footprints.items():
+        print(
+            f"{name:<25}{dataset_bytes/1e6:>15.1f}{primary_bytes/1e6:>15.1f}"
+            f"{(dataset_bytes + primary_bytes)/1e6:>15.1f}"
+        )
+
+if __name__ == "__main__":
+    main()
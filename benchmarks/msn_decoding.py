@@ -0,0 +1,74 @@
+# Purpose: compare decoding MSNs per row with the joined MSN dimension table
+# Usage: python -m benchmarks.msn_decoding [--repeat 5] [--data DIR]
+#
+# Both ingest the same consumption rows, read once beforehand, so the times
+# leave out reading the CSV file. row_level_ingest is ingest_rows as it was
+# before the dimension table, kept to time and check against.
+
+import argparse
+import time
+
+import pandas as pd
+
+import data_processing as dp
+
+def row_level_ingest(df, categorical=False, downcast=False) -> pd.DataFrame:
+    state_abbr_map = dp.map_from_csv(dp.STATES_PATH)
+    energy_codes_map = dp.map_from_csv(dp.ENERGY_CODES_PATH)
+    sector_codes_map = dp.map_from_csv(dp.SECTOR_CODES_PATH)
+    unit_codes_map = dp.map_from_csv(dp.UNIT_CODES_PATH)
+
+    df = dp.create_code_columns(df)
+    df.loc[df["Sector_code"] == "ET", "Sector_code"] = "TC"
+    df = df.rename(columns={"State": "Abbreviation"})
+
+    df["State"] = df["Abbreviation"].map(state_abbr_map)
+    df["Source"] = df["Energy_code"].map(energy_codes_map)
+    df["Sector"] = df["Sector_code"].map(sector_codes_map)
+    df["Unit"] = df["Unit_code"].map(unit_codes_map)
+
+    per_capita_rows = df["Sector"].str.contains("per capita")
+    df.loc[per_capita_rows, "Unit"] = "Million BTU"
+
+    df = df.drop(columns=["Data_Status", "MSN", "Abbreviation",
+                          "Energy_code", "Sector_code", "Unit_code"])
+
+    id_vars = ["State", "Source", "Sector", "Unit"]
+    if categorical:
+        for column in id_vars:
+            df[column] = df[column].astype("category")
+    df = df.melt(id_vars=id_vars, var_name="Year", value_name="BTU")
+    df["Year"] = df["Year"].astype(int)
+    return dp.compact_dataset(df, categorical, downcast)
+
+def best_time(ingest, rows, categorical, repeat) -> tuple:
+    """Return the best of repeat ingestions of rows and the last dataset"""
+    times = []
+    for _ in range(repeat):
+        # Each ingestion gets its own copy, the row-level one adds columns
+        wide = rows.copy()
+        start = time.perf_counter()
+        df = ingest(wide, categorical)
+        times.append(time.perf_counter() - start)
+    return min(times), df
+
+def main():
+    parser = argparse.ArgumentParser(description="Time MSN decoding during ingestion")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--data", help="data directory written by benchmarks.synthetic_seds")
+    args = parser.parse_args()
+    if args.data:
+        dp.set_data_dir(args.data)
+
+    rows = dp.read_consumption_rows(chunksize=dp.INGEST_CHUNKSIZE)
+    print(f"{len(rows)} rows, {rows['MSN'].nunique()} distinct MSNs")
+    print(f"{'Variant':<15}{'Per row (s)':>15}{'Joined (s)':>15}{'Speedup':>10}")
+    for categorical in [False, True]:
+        row_level, expected = best_time(row_level_ingest, rows, categorical, args.repeat)
+        joined, df = best_time(dp.ingest_rows, rows, categorical, args.repeat)
+        pd.testing.assert_frame_equal(df, expected)
+        name = "categorical" if categorical else "default"
+        print(f"{name:<15}{row_level:>15.3f}{joined:>15.3f}{row_level/joined:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# Purpose: check that the app serves a freshly pre-rendered figure store
+# Usage: python -m benchmarks.prerendered [--data DIR] [--states 10]
+#
+# prerender.py writes the store into a temporary directory, which the app
+# then opens under the key of its own dataset version. The state history of
+# a few states is requested with the figure and response caches cleared
+# before every request, once built and once from the store. Fails if the
+# store isn't opened or a request from it builds a figure.
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import data_processing as dp
+import figure_store as fs
+import plot_computations as pc
+import prerender
+from benchmarks.run import _callback_request
+from benchmarks.state_history import percentiles
+
+def main():
+    parser = argparse.ArgumentParser(description="Check serving the pre-rendered figure store")
+    parser.add_argument("--data", help="data directory written by benchmarks.synthetic_seds")
+    parser.add_argument("--states", type=int, default=10, help="number of states to request")
+    args = parser.parse_args()
+    if args.data:
+        dp.set_data_dir(args.data)
+    os.environ.setdefault("WARMUP_WORKERS", "0")
+
+    import app
+
+    with tempfile.TemporaryDirectory() as out:
+        count = prerender.prerender(out)
+        store = fs.open_store(app.dv.current().key, out)
+        if store is None:
+            print(f"The app didn't open the store of {count} figures prerender.py wrote")
+            sys.exit(1)
+
+        client = app.server.test_client()
+        states = app.ro.consumption_rollup(app.dv.current().primary_df).state_totals.states
+        requests = [(state, depiction) for state in states[:args.states]
+                    for depiction in pc.HISTORY_DEPICTIONS]
+        times = {}
+        for name, figure_store in [("built", None), ("from the store", store)]:
+            app.figure_store = figure_store
+            misses = app.figure_cache.stats()["misses"]
+            times[name] = []
+            for state, depiction in requests:
+                app.figure_cache.invalidate()
+                app.responses.RESPONSE_CACHE.clear()
+                body = _callback_request(
+                    [("state-history-header", "children"), ("state-history", "figure")],
+                    [("state-history-state", "value", state),
+                     ("state-history-type", "value", depiction),
+                     ("x-axis-labels", "value", pc.X_AXIS_TYPES[0])])
+                start = time.perf_counter()
+                response = client.post("/_dash-update-component", json=body)
+                times[name].append(time.perf_counter() - start)
+                assert response.status_code == 200, response.status_code
+            built = app.figure_cache.stats()["misses"] - misses
+
+    print(f"{count} figures pre-rendered, {len(requests)} requests")
+    print(f"{'Path':<18}{'Median (ms)':>12}{'p95 (ms)':>12}")
+    for name, request_times in times.items():
+        median, p95 = percentiles(request_times)
+        print(f"{name:<18}{median:>12.2f}{p95:>12.2f}")
+    if built:
+        print(f"{built} requests from the store built their figure")
+        sys.exit(1)
+    print("Every request from the store was served from it")
+
+if __name__ == "__main__":
+    main()
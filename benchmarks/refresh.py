@@ -0,0 +1,54 @@
+# Purpose: compare an incremental dataset refresh with a full reload
+# Usage: python -m benchmarks.refresh [--data DIR]
+#
+# The SEDS file of DIR is copied without its last year, loaded, and then
+# refreshed with the full file, as when EIA publishes a new year.
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+import data_processing as dp
+import dataset_cache
+import dataset_versions as dv
+import rollups as ro
+
+def main():
+    parser = argparse.ArgumentParser(description="Time an incremental dataset refresh")
+    parser.add_argument("--data", help="data directory written by benchmarks.synthetic_seds")
+    args = parser.parse_args()
+    data_dir = args.data or dp.DATA_DIR
+
+    seds = pd.read_csv(os.path.join(data_dir, "use_all_btu.csv"))
+    last_year = dp.year_columns(seds)[-1]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        shutil.copy(os.path.join(data_dir, "states.csv"), tmp_dir)
+        seds_path = os.path.join(tmp_dir, "use_all_btu.csv")
+        seds.drop(columns=[last_year]).to_csv(seds_path, index=False)
+        dp.set_data_dir(tmp_dir)
+        # Keep the cache of the real dataset out of it
+        dataset_cache.CACHE_DIR = os.path.join(tmp_dir, "cache")
+        version = dv.load()
+        ro.build_rollups(version.df, version.primary_df)
+        dv.activate(version)
+
+        seds.to_csv(seds_path, index=False)
+        start = time.perf_counter()
+        dv.refresh()
+        refresh = time.perf_counter() - start
+
+        start = time.perf_counter()
+        df, primary_df = dp.load_datasets(categorical=True, use_cache=False)
+        ro.build_rollups(df, primary_df)
+        reload = time.perf_counter() - start
+
+    print(f"Adding {last_year} to {len(seds)} rows")
+    print(f"{'Full reload (s)':>18}{'Refresh (s)':>15}")
+    print(f"{reload:>18.2f}{refresh:>15.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+# Purpose: time the data pipeline, plot builders and callbacks
+# Usage: python -m benchmarks.run [--output benchmarks/results.json]
+#                                 [--baseline benchmarks/baseline.json]
+#                                 [--save-baseline] [--filter NAME]
+#                                 [--data DIR | --synthetic]
+#
+# Results are written as JSON. Every benchmark is compared against the
+# baseline relative to a fixed calibration workload timed just before it,
+# and the run fails if any regressed by more than --threshold, or if there
+# is no baseline. The committed baseline was measured with --synthetic, on
+# the data benchmarks.synthetic_seds writes with its defaults and seed 0,
+# the same on every machine. Its metadata records the machine and library
+# versions it was measured with.
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+
+import dash
+import numpy as np
+import pandas as pd
+import plotly
+
+import data_processing as dp
+import dataset_cache
+import plot_computations as pc
+import rollups as ro
+from benchmarks import synthetic_seds
+
+RESULTS_PATH = os.path.join("benchmarks", "results.json")
+BASELINE_PATH = os.path.join("benchmarks", "baseline.json")
+
+class Benchmark:
+    """A named callable timed over warmup + repeat calls
+
+    setup, if given, runs untimed before every call.
+    """
+
+    def __init__(self, name, func, repeat=20, warmup=2, setup=None):
+        self.name = name
+        self.func = func
+        self.repeat = repeat
+        self.warmup = warmup
+        self.setup = setup or (lambda: None)
+
+    def run(self) -> dict:
+        for _ in range(self.warmup):
+            self.setup()
+            self.func()
+        times = []
+        for _ in range(self.repeat):
+            self.setup()
+            start = time.perf_counter()
+            self.func()
+            times.append(time.perf_counter() - start)
+        times.sort()
+        return {
+            "repeat": self.repeat,
+            "min": times[0],
+            "median": statistics.median(times),
+            "mean": statistics.mean(times),
+            "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+            "p95": times[min(len(times) - 1, round(0.95*(len(times) - 1)))],
+        }
+
+CALIBRATION = "calibration"
+
+def calibration_benchmark() -> Benchmark:
+    """Return a fixed pandas workload, timed just before every benchmark
+
+    Each median is also recorded relative to it, which holds across
+    machines and across the slower and faster stretches of a shared one.
+    """
+    rng = np.random.default_rng(0)
+    frame = pd.DataFrame({
+        "key": pd.Categorical(rng.integers(0, 50, 200_000)),
+        "value": rng.random(200_000),
+    })
+    return Benchmark(CALIBRATION, lambda: (
+        frame.groupby("key", observed=True)["value"].sum(), np.sort(frame["value"].to_numpy())
+    ), repeat=5, warmup=1)
+
+def pipeline_benchmarks(df) -> list:
+    latest_year = int(df["Year"].max())
+    return [
+        Benchmark("load_dataset", dp.load_dataset, repeat=3, warmup=1),
+        Benchmark("load_dataset[categorical]",
+                  lambda: dp.load_dataset(categorical=True), repeat=3, warmup=1),
+        Benchmark("load_primary_energy_sources",
+                  lambda: dp.load_primary_energy_sources(df), repeat=5),
+        Benchmark("data_subset[state, year]",
+                  lambda: dp.data_subset(df, states="Texas", years=[latest_year])),
+        Benchmark("data_subset[state]", lambda: dp.data_subset(df, states="Texas")),
+        Benchmark("data_subset[sector]", lambda: dp.data_subset(df, sectors=["Total"])),
+        Benchmark("data_subset[all]", lambda: dp.data_subset(df), repeat=5),
+    ]
+
+def builder_benchmarks(df, primary_df, geojson) -> list:
+    latest_year = int(df["Year"].max())
+    benchmarks = [
+        Benchmark("build_rollups", lambda: (
+            ro.build_per_capita_rollup(df), ro.build_consumption_rollup(primary_df),
+            ro.build_state_history_rollup(primary_df)
+        ), repeat=5),
+    ]
+    for depiction in pc.MAIN_DEPICTIONS:
+        for x_axis in pc.X_AXIS_TYPES:
+            benchmarks.append(Benchmark(
+                f"us_total[{depiction}, {x_axis}]",
+                lambda depiction=depiction, x_axis=x_axis: pc.us_total(df, primary_df, depiction, x_axis)
+            ))
+    for depiction in pc.STATE_DEPICTIONS:
+        benchmarks.append(Benchmark(
+            f"precompute_state_per_year[{depiction}]",
+            lambda depiction=depiction: pc.precompute_state_per_year(df, primary_df, depiction, latest_year)
+        ))
+    for depiction in pc.HISTORY_DEPICTIONS:
+        benchmarks.append(Benchmark(
+            f"state_history[{depiction}]",
+            lambda depiction=depiction: pc.state_history(df, primary_df, "Texas", depiction, "Year")
+        ))
+    benchmarks += [
+        Benchmark("pie_plot_per_year", lambda: pc.pie_plot_per_year(primary_df, latest_year)),
+        Benchmark("us_primary_per_year", lambda: pc.us_primary_per_year(primary_df, latest_year)),
+        Benchmark("update_choropleth", lambda: pc.update_choropleth(df, geojson), repeat=3, warmup=1),
+        Benchmark("choropleth_per_year", lambda: pc.choropleth_per_year(df, geojson, latest_year)),
+    ]
+    return benchmarks
+
+def _callback_request(outputs, inputs) -> dict:
+    """Return the body Dash posts to _dash-update-component"""
+    outputs = [{"id": component, "property": prop} for component, prop in outputs]
+    return {
+        "output": ".." + "...".join(f"{o['id']}.{o['property']}" for o in outputs) + ".."
+                  if len(outputs) > 1 else f"{outputs[0]['id']}.{outputs[0]['property']}",
+        "outputs": outputs if len(outputs) > 1 else outputs[0],
+        "inputs": [{"id": component, "property": prop, "value": value}
+                   for component, prop, value in inputs],
+        "changedPropIds": [f"{component}.{prop}" for component, prop, _ in inputs],
+    }
+
+def callback_benchmarks() -> list:
+    """Return benchmarks posting each app.py callback through Dash
+
+    The same body is posted each time. Cold calls empty the figure and
+    response caches first, so every call builds its figures; warm calls are
+    served from the response cache after the first.
+    """
+    # The warm-up threads would compete with the timed requests
+    os.environ["WARMUP_WORKERS"] = "0"
+    import app
+
+    # Time building the figures whether or not prerender.py has been run
+    app.figure_store = None
+    client = app.server.test_client()
+    latest_year = app.dv.current().years[-1]
+    state = ro.consumption_rollup(app.dv.current().primary_df).state_totals.states[0]
+
+    def post(body):
+        def request():
+            response = client.post("/_dash-update-component", json=body)
+            assert response.status_code == 200, response.status_code
+        return request
+
+    def cold():
+        app.figure_cache.invalidate()
+        app.responses.RESPONSE_CACHE.clear()
+
+    click = {"points": [{"x": f"{latest_year}-01-01"}]}
+    year_outputs = [
+        ("us-primary-header", "children"), ("us-pie-header", "children"),
+        ("us-primary-bar", "figure"), ("us-primary-pie", "figure"),
+        ("state-plot-header", "children"), ("state-total-bar", "figure"),
+    ]
+    callbacks = [
+        ("update_main_plot_header", _callback_request(
+            [("main-plot-header", "children")],
+            [("main-plot-type", "value", pc.MAIN_DEPICTIONS[0])])),
+        ("update_main_plot", _callback_request(
+            [("us-total", "figure")],
+            [("main-plot-type", "value", pc.MAIN_DEPICTIONS[0]),
+             ("x-axis-labels", "value", "President")])),
+        ("update_year_selection", _callback_request(
+            year_outputs,
+            [("state-plot-type", "value", pc.STATE_DEPICTIONS[0]),
+             ("us-total", "clickData", click)])),
+        ("update_choropleth_values", _callback_request(
+            [("choropleth-values", "data")],
+            [("year-slider", "value", latest_year)])),
+        ("select_history_state", _callback_request(
+            [("state-history-state", "value")],
+            [("state-total-bar", "clickData", {"points": [{"x": state}]})])),
+        ("update_state_history", _callback_request(
+            [("state-history-header", "children"), ("state-history", "figure")],
+            [("state-history-state", "value", state),
+             ("state-history-type", "value", pc.HISTORY_DEPICTIONS[0]),
+             ("x-axis-labels", "value", pc.X_AXIS_TYPES[0])])),
+    ]
+    benchmarks = []
+    for name, body in callbacks:
+        benchmarks.append(Benchmark(f"callback:{name}[cold]", post(body), setup=cold))
+        benchmarks.append(Benchmark(f"callback:{name}[warm]", post(body)))
+    return benchmarks
+
+def compare(results, baseline, threshold, min_delta=0.0) -> list:
+    """Print each median against baseline and return the regressed names
+
+    Ratios are of the medians relative to the calibration run before each
+    benchmark. A median regressed when its ratio is over threshold and it is
+    more than min_delta seconds slower than the baseline scaled by that
+    ratio's calibration, so that the timer noise of sub-millisecond calls
+    doesn't count.
+    """
+    regressions = []
+    print(f"{'Benchmark':<60}{'Median (ms)':>12}{'Baseline':>12}{'Ratio':>8}")
+    for name, result in results.items():
+        median = result["median"]*1000
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<60}{median:>12.2f}{'-':>12}{'-':>8}")
+            continue
+        ratio = result["relative"]/base["relative"]
+        scaled = base["median"]*result["calibration"]/base["calibration"]
+        regressed = ratio > threshold and result["median"] - scaled > min_delta
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<60}{median:>12.2f}{base['median']*1000:>12.2f}{ratio:>8.2f}{flag}")
+        if regressed:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the benchmark suite")
+    parser.add_argument("--output", default=RESULTS_PATH)
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store these results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="median ratio to the baseline counted as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                        help="smallest slowdown of a median counted as a regression")
+    parser.add_argument("--filter", default="", help="only run benchmarks containing this")
+    data = parser.add_mutually_exclusive_group()
+    data.add_argument("--data", help="data directory written by benchmarks.synthetic_seds")
+    data.add_argument("--synthetic", action="store_true",
+                      help="run on synthetic_seds data with its defaults, as the baseline was")
+    args = parser.parse_args()
+    if not args.save_baseline and not os.path.exists(args.baseline):
+        sys.exit(f"No baseline at {args.baseline} to compare against, "
+                 "run with --save-baseline first")
+    if args.synthetic:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            synthetic_seds.generate(tmp_dir)
+            dp.set_data_dir(tmp_dir)
+            # Keep the cache of the real data out of it
+            dataset_cache.CACHE_DIR = os.path.join(tmp_dir, "cache")
+            run(args)
+    else:
+        if args.data:
+            dp.set_data_dir(args.data)
+        run(args)
+
+def run(args):
+    """Run the benchmarks on the current data directory and compare them"""
+    import geography as geo
+    import plotting
+
+    df, primary_df = dp.load_datasets(categorical=True)
+    geojson = geo.geojson_for_zoom(plotting.MAPBOX_ZOOM)
+    benchmarks = (
+        pipeline_benchmarks(df)
+        + builder_benchmarks(df, primary_df, geojson)
+        + callback_benchmarks()
+    )
+
+    calibration = calibration_benchmark()
+    results = {}
+    for benchmark in benchmarks:
+        if args.filter in benchmark.name:
+            calibration_min = calibration.run()["min"]
+            result = benchmark.run()
+            result["calibration"] = calibration_min
+            result["relative"] = result["min"]/calibration_min
+            results[benchmark.name] = result
+
+    report = {
+        "metadata": {
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "plotly": plotly.__version__,
+            "dash": dash.__version__,
+            "machine": platform.machine(),
+            "data_dir": None if args.synthetic else dp.DATA_DIR,
+            "synthetic": args.synthetic,
+            "dataset_key": dp.dataset_key(),
+            "rows": len(df),
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as outfile:
+        json.dump(report, outfile, indent=2)
+
+    baseline = {}
+    if not args.save_baseline:
+        with open(args.baseline) as infile:
+            stored = json.load(infile)
+        baseline = stored["results"]
+        if stored["metadata"]["dataset_key"] != report["metadata"]["dataset_key"]:
+            print(f"The baseline was measured on other data than this run, "
+                  f"synthetic: {stored['metadata'].get('synthetic', False)}")
+    regressions = compare(results, baseline, args.threshold, args.min_delta_ms/1000)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as outfile:
+            json.dump(report, outfile, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold}x")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
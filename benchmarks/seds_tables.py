@@ -0,0 +1,51 @@
+# Purpose: exercise the SEDS table registry under a memory budget
+# Usage: python -m benchmarks.seds_tables DIR [--budget-mb 64] [--rounds 3]
+#
+# DIR is written by benchmarks.synthetic_seds with --tables. Every table is
+# requested in turn, round after round, so a budget smaller than all of them
+# together evicts on every request after the first round. The first round
+# loads from the files, later loads come from the on-disk cache.
+
+import argparse
+import os
+import tempfile
+import time
+
+import data_processing as dp
+import dataset_cache
+import seds_tables
+
+def main():
+    parser = argparse.ArgumentParser(description="Exercise the SEDS table registry")
+    parser.add_argument("data", help="data directory written by benchmarks.synthetic_seds --tables")
+    parser.add_argument("--budget-mb", type=float, default=64)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    dp.set_data_dir(args.data)
+
+    registry = seds_tables.TableRegistry(budget=int(args.budget_mb*2**20))
+    names = registry.available()
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Keep the cache of the real tables out of it
+        dataset_cache.CACHE_DIR = os.path.join(tmp_dir, "cache")
+        print(f"{'Round':<7}{'Table':<14}{'Request (s)':>12}{'Resident (MB)':>15}")
+        for round_number in range(args.rounds):
+            for name in names:
+                start = time.perf_counter()
+                registry.get(name)
+                seconds = time.perf_counter() - start
+                print(f"{round_number:<7}{name:<14}{seconds:>12.3f}"
+                      f"{registry.resident_bytes()/2**20:>15.1f}")
+
+    stats = registry.stats()
+    print()
+    print(f"{'Event':<8}{'Table':<14}{'Source':<8}{'Load (s)':>10}{'Size (MB)':>11}")
+    for event in stats["events"]:
+        seconds = event.get("seconds")
+        print(f"{event['event']:<8}{event['table']:<14}{event.get('source', ''):<8}"
+              f"{'' if seconds is None else f'{seconds:.3f}':>10}{event['bytes']/2**20:>11.1f}")
+    print(f"{stats['loads']} loads, {stats['evictions']} evictions, {stats['hits']} hits "
+          f"within {args.budget_mb:g} MB")
+
+if __name__ == "__main__":
+    main()
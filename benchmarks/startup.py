@@ -0,0 +1,25 @@
+# Purpose: compare dataset load time with a cold and a warm on-disk cache
+# Usage: python -m benchmarks.startup
+
+import time
+
+import data_processing as dp
+import dataset_cache
+
+def time_load(**options) -> float:
+    start = time.perf_counter()
+    dp.load_datasets(**options)
+    return time.perf_counter() - start
+
+def main():
+    print(f"{'Variant':<15}{'Uncached (s)':>15}{'Cold (s)':>15}{'Warm (s)':>15}")
+    for categorical in [False, True]:
+        uncached = time_load(categorical=categorical, use_cache=False)
+        dataset_cache.clear()
+        cold = time_load(categorical=categorical)
+        warm = time_load(categorical=categorical)
+        name = "categorical" if categorical else "default"
+        print(f"{name:<15}{uncached:>15.2f}{cold:>15.2f}{warm:>15.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# Purpose: check the latency of switching states in the state history panel
+# Usage: python -m benchmarks.state_history [--data DIR] [--states 200]
+#                                           [--target-ms 20]
+#
+# Each state and depiction is requested once through the Dash callback, so
+# every request builds its figure rather than hitting a cache. The same
+# figures are then built from the dataset's rollups, and from the rows of the
+# state scanned out of the dataset with data_subset per request, as they
+# would be without the per-state rollup. Fails if the p95 latency of the
+# callback is over --target-ms.
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import data_processing as dp
+import plot_computations as pc
+import rollups as ro
+from benchmarks.run import _callback_request
+
+def scanned_history(total_df, primary_df, state, depiction_type, x_axis_type):
+    """Return state_history built from a data_subset scan per request
+
+    The subsets are new frames, so their rollups are built for the request
+    and dropped with them.
+    """
+    return pc.state_history(dp.data_subset(total_df, states=[state]),
+                            dp.data_subset(primary_df, states=[state]),
+                            state, depiction_type, x_axis_type)
+
+def percentiles(times) -> tuple:
+    """Return the median and p95 of times in milliseconds"""
+    times = sorted(times)
+    p95 = times[min(len(times) - 1, round(0.95*(len(times) - 1)))]
+    return statistics.median(times)*1000, p95*1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Time switching states in the state history")
+    parser.add_argument("--data", help="data directory written by benchmarks.synthetic_seds")
+    parser.add_argument("--states", type=int, default=200, help="number of states to switch through")
+    parser.add_argument("--target-ms", type=float, default=20)
+    args = parser.parse_args()
+    if args.data:
+        dp.set_data_dir(args.data)
+    os.environ.setdefault("WARMUP_WORKERS", "0")
+
+    import app
+
+    # Every request builds its figure
+    app.figure_store = None
+    dataset = app.dv.current()
+    states = ro.consumption_rollup(dataset.primary_df).state_totals.states[:args.states]
+    client = app.server.test_client()
+    requests = [(state, depiction) for state in states for depiction in pc.HISTORY_DEPICTIONS]
+
+    callback_times = []
+    for state, depiction in requests:
+        body = _callback_request(
+            [("state-history-header", "children"), ("state-history", "figure")],
+            [("state-history-state", "value", state),
+             ("state-history-type", "value", depiction),
+             ("x-axis-labels", "value", pc.X_AXIS_TYPES[0])])
+        start = time.perf_counter()
+        response = client.post("/_dash-update-component", json=body)
+        callback_times.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.status_code
+
+    index_times, scan_times = [], []
+    for state, depiction in requests:
+        start = time.perf_counter()
+        pc.state_history(dataset.df, dataset.primary_df, state, depiction, pc.X_AXIS_TYPES[0])
+        index_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        scanned_history(dataset.df, dataset.primary_df, state, depiction, pc.X_AXIS_TYPES[0])
+        scan_times.append(time.perf_counter() - start)
+
+    print(f"{len(dataset.df)} rows, {len(requests)} requests over {len(states)} states")
+    print(f"{'Path':<28}{'Median (ms)':>12}{'p95 (ms)':>12}")
+    for name, times in [("callback", callback_times), ("figure from the index", index_times),
+                        ("figure from a scan", scan_times)]:
+        median, p95 = percentiles(times)
+        print(f"{name:<28}{median:>12.2f}{p95:>12.2f}")
+
+    p95 = percentiles(callback_times)[1]
+    if p95 > args.target_ms:
+        print(f"Callback p95 of {p95:.1f} ms is over the {args.target_ms:g} ms target")
+        sys.exit(1)
+    print(f"Callback p95 within the {args.target_ms:g} ms target")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# Purpose: write a synthetic SEDS-shaped data directory for scale testing
+# Usage: python -m benchmarks.synthetic_seds OUT_DIR [--regions 52] [--msns 555]
+#                                            [--years 59] [--scale 10] [--tables]
+#
+# OUT_DIR gets a use_all_btu.csv with the layout of the real file and a
+# states.csv naming every region in it, and with --tables a file for each of
+# the other SEDS tables of seds_tables.py. Run the pipeline and dashboard on
+# it with SEDS_DATA_DIR=OUT_DIR, or the benchmarks with --data OUT_DIR.
+#
+# The defaults match the real file: 555 MSNs, of which the pipeline keeps
+# the same share as consumption series, for each of 52 regions. --scale
+# multiplies the regions, so it multiplies the processed dataset too.
+
+import argparse
+import csv
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+import data_processing as dp
+import seds_tables
+
+STATES_PATH = os.path.join("data", "states.csv")
+FIRST_YEAR = 1960
+
+# Series the dashboard plots, always generated for every region
+PRIMARY_ENERGY_CODES = ["RE", "NN", "CL", "NU", "PA"]
+REQUIRED_MSNS = [
+    f"{energy_code}{sector_code}B"
+    for energy_code in PRIMARY_ENERGY_CODES
+    for sector_code in ["TC", "AC", "CC", "IC", "RC", "EI"]
+] + ["TETCB", "TETPB", "TPOPP"]
+# Consumption MSNs out of all of the MSNs in the real file, 397 of 555
+CONSUMPTION_SHARE = 397/555
+
+def _codes(fpath) -> list:
+    return list(dp.map_from_csv(fpath))
+
+def msn_universe(msns, seed=0) -> list:
+    """Return msns MSNs valid against the code tables, required ones first
+
+    The rest are drawn from every energy, sector and unit combination, so
+    like the real file they include series the pipeline filters out, in the
+    real file's proportion of CONSUMPTION_SHARE consumption series.
+    """
+    msns = max(msns, len(REQUIRED_MSNS))
+    combinations = np.array([
+        "".join(codes) for codes in itertools.product(
+            _codes(dp.ENERGY_CODES_PATH), _codes(dp.SECTOR_CODES_PATH), _codes(dp.UNIT_CODES_PATH)
+        ) if "".join(codes) not in REQUIRED_MSNS
+    ])
+    np.random.default_rng(seed).shuffle(combinations)
+    consumption = dp.consumption_msns(combinations)
+
+    required_consumption = int(dp.consumption_msns(REQUIRED_MSNS).sum())
+    consumption_msns = max(round(msns*CONSUMPTION_SHARE) - required_consumption, 0)
+    other_msns = msns - len(REQUIRED_MSNS) - consumption_msns
+    if consumption_msns > consumption.sum() or other_msns > (~consumption).sum():
+        raise ValueError(f"At most {required_consumption + consumption.sum()} consumption and "
+                         f"{(~consumption).sum()} other MSNs can be generated")
+    extra = list(combinations[consumption][:consumption_msns]) \
+        + list(combinations[~consumption][:other_msns])
+    return REQUIRED_MSNS + extra
+
+def table_msns(table, msns, seed=0) -> list:
+    """Return up to msns MSNs the SEDS table keeps"""
+    combinations = [
+        "".join(codes) for codes in itertools.product(
+            _codes(dp.ENERGY_CODES_PATH), table.sector_codes, table.unit_codes)
+    ]
+    np.random.default_rng(seed).shuffle(combinations)
+    return combinations[:msns]
+
+def region_table(regions) -> list:
+    """Return (abbreviation, name) of the United States, the real states and
+    then as many synthetic regions as it takes to make regions"""
+    real = dp.map_from_csv(STATES_PATH)
+    table = [("US", real.pop("US"))] + list(real.items())
+    table += [(f"Z{i:04d}", f"Synthetic region {i}") for i in range(regions - len(table))]
+    return table[:max(regions, 1)]
+
+def _region_rows(abbreviation, msns, years, status, rng) -> pd.DataFrame:
+    # Each series follows its own level and trend with multiplicative noise
+    level = rng.lognormal(mean=8, sigma=2, size=(len(msns), 1))
+    trend = 1 + rng.normal(0.01, 0.01, size=(len(msns), 1))*np.arange(len(years))
+    noise = rng.uniform(0.9, 1.1, size=(len(msns), len(years)))
+    values = pd.DataFrame(np.round(level*trend.clip(0.05)*noise, 3), columns=years)
+    values.insert(0, "MSN", msns)
+    values.insert(0, "State", abbreviation)
+    values.insert(0, "Data_Status", status)
+    return values
+
+def _write_seds(path, table, msn_list, year_columns, status, rng) -> None:
+    with open(path, "w", newline="") as outfile:
+        outfile.write(",".join(["Data_Status", "State", "MSN"] + year_columns) + "\n")
+        # One region at a time keeps memory flat however large the file is
+        for abbreviation, _ in table:
+            _region_rows(abbreviation, msn_list, year_columns, status, rng).to_csv(
+                outfile, header=False, index=False)
+
+def generate(out_dir, regions=52, msns=555, years=59, seed=0, tables=False) -> str:
+    """Write a synthetic data directory to out_dir and return its SEDS path"""
+    os.makedirs(out_dir, exist_ok=True)
+    table = region_table(regions)
+    msn_list = msn_universe(msns, seed)
+    year_columns = [str(year) for year in range(FIRST_YEAR, FIRST_YEAR + years)]
+    status = f"{FIRST_YEAR + years - 1}F"
+
+    with open(os.path.join(out_dir, "states.csv"), "w", newline="") as outfile:
+        writer = csv.writer(outfile)
+        writer.writerow(["Abbreviation", "State"])
+        writer.writerows(table)
+
+    seds_path = os.path.join(out_dir, "use_all_btu.csv")
+    rng = np.random.default_rng(seed)
+    _write_seds(seds_path, table, msn_list, year_columns, status, rng)
+    if tables:
+        for seds_table in seds_tables.TABLES.values():
+            _write_seds(os.path.join(out_dir, seds_table.fname), table,
+                        table_msns(seds_table, msns, seed), year_columns, status, rng)
+    return seds_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic SEDS data directory")
+    parser.add_argument("out_dir")
+    parser.add_argument("--regions", type=int, default=52)
+    parser.add_argument("--msns", type=int, default=555)
+    parser.add_argument("--years", type=int, default=59)
+    parser.add_argument("--scale", type=int, default=1,
+                        help="multiply the number of regions, e.g. 10 or 100")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tables", action="store_true",
+                        help="also write the other SEDS tables")
+    args = parser.parse_args()
+
+    seds_path = generate(args.out_dir, args.regions*args.scale, args.msns, args.years,
+                         args.seed, args.tables)
+    size = os.path.getsize(seds_path)
+    print(f"Wrote {seds_path} ({size/1e6:.0f} MB, {args.regions*args.scale} regions, "
+          f"{args.msns} MSNs, {args.years} years)")
+
+if __name__ == "__main__":
+    main()
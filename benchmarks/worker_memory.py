@@ -0,0 +1,75 @@
+# Purpose: measure resident memory per worker as the worker count grows
+# Usage: python -m benchmarks.worker_memory [--workers 1 2 4 8]
+#
+# Each worker is forked before it loads any data, the way gunicorn starts
+# workers without --preload. PSS splits shared pages between the processes
+# that map them, so it shows how much memory each worker really costs.
+
+import argparse
+import multiprocessing
+
+import data_processing as dp
+import rollups as ro
+import shared_dataset as sd
+
+MODES = ["copy", "shared"]
+
+def _memory_kb(pid) -> dict:
+    """Return the Rss and Pss of pid in kB (Linux only)"""
+    memory = {}
+    with open(f"/proc/{pid}/smaps_rollup") as infile:
+        for line in infile:
+            field, value = line.split(":", 1)
+            if field in ("Rss", "Pss"):
+                memory[field] = int(value.split()[0])
+    return memory
+
+def _worker(mode, ready, done) -> None:
+    if mode == "shared":
+        df, primary_df = sd.load_shared()
+    else:
+        df, primary_df = dp.load_datasets(categorical=True)
+    ro.build_rollups(df, primary_df)
+    # Touch every column the way callbacks would
+    df["BTU"].sum()
+    primary_df["BTU"].sum()
+    ready.set()
+    done.wait()
+
+def measure(mode, workers) -> list:
+    """Return the memory of each of workers processes loading in mode"""
+    context = multiprocessing.get_context("fork")
+    done = context.Event()
+    processes = []
+    for _ in range(workers):
+        ready = context.Event()
+        process = context.Process(target=_worker, args=(mode, ready, done))
+        process.start()
+        processes.append((process, ready))
+    for _, ready in processes:
+        ready.wait()
+
+    memory = [_memory_kb(process.pid) for process, _ in processes]
+    done.set()
+    for process, _ in processes:
+        process.join()
+    return memory
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure memory per worker")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    # Build the on-disk cache and the shared export outside the measurement
+    sd.load_shared()
+
+    print(f"{'Mode':<10}{'Workers':>10}{'RSS/worker (MB)':>20}{'PSS/worker (MB)':>20}{'PSS total (MB)':>20}")
+    for mode in MODES:
+        for workers in args.workers:
+            memory = measure(mode, workers)
+            rss = sum(item["Rss"] for item in memory)/1024
+            pss = sum(item["Pss"] for item in memory)/1024
+            print(f"{mode:<10}{workers:>10}{rss/workers:>20.1f}{pss/workers:>20.1f}{pss:>20.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,31 @@
 import csv
+import functools
 import os
 import datetime
+import weakref
 
+import numpy as np
 import pandas as pd
 
+import dataset_cache
+import metrics
+
+# Directory of the SEDS file and its state table, e.g. one written by
+# benchmarks/synthetic_seds.py
+DATA_DIR = os.environ.get("SEDS_DATA_DIR", "data")
+SEDS_PATH = os.path.join(DATA_DIR, "use_all_btu.csv")
+STATES_PATH = os.path.join(DATA_DIR, "states.csv")
+ENERGY_CODES_PATH = os.path.join("data", "energy_codes.csv")
+SECTOR_CODES_PATH = os.path.join("data", "sector_codes.csv")
+UNIT_CODES_PATH = os.path.join("data", "unit_codes.csv")
+
+def set_data_dir(path) -> None:
+    """Read the SEDS file and state table from path from now on"""
+    global DATA_DIR, SEDS_PATH, STATES_PATH
+    DATA_DIR = path
+    SEDS_PATH = os.path.join(path, "use_all_btu.csv")
+    STATES_PATH = os.path.join(path, "states.csv")
+
 def map_from_csv(fpath: str, drop_header=True) -> dict:
     with open(fpath, mode='r') as infile:
         reader = csv.reader(infile)
@@ -11,92 +33,327 @@ def map_from_csv(fpath: str, drop_header=True) -> dict:
             next(reader, None)
         return {rows[0]: rows[1] for rows in reader}
 
+def code_map(fpath: str) -> dict:
+    """Return map_from_csv(fpath), read once per version of the file
+
+    Every dataset decodes through the same dicts, so their names are the
+    same strings rather than a copy per dataset.
+    """
+    return _code_map(fpath, os.stat(fpath).st_mtime_ns)
+
+@functools.lru_cache(maxsize=16)
+def _code_map(fpath, mtime) -> dict:
+    return map_from_csv(fpath)
+
 def create_code_columns(df) -> pd.DataFrame:
     df["Energy_code"] = df["MSN"].str[0:2]
     df["Sector_code"] = df["MSN"].str[2:4]
     df["Unit_code"] = df["MSN"].str[4]
     return df
 
-def _determine_subset_list(arg, default):
-    if arg is not None:
-        if isinstance(arg, str):
-            arg = [arg]
-    else:
-        arg = default
+def _determine_subset_list(arg):
+    if isinstance(arg, str):
+        arg = [arg]
     return arg
 
+def _smallest_int(maximum):
+    """Return the smallest signed integer dtype that holds maximum"""
+    for dtype in (np.int8, np.int16, np.int32):
+        if maximum <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+class _DimensionIndex:
+    """Row positions of a single column grouped by value
+
+    A categorical column's own codes are used as they are, any other column
+    is factorized into codes of the smallest dtype that fits. Positions are
+    stored in the smallest dtype that fits the number of rows. With arrays,
+    the index is made of the arrays() of an index built earlier instead.
+    """
+
+    def __init__(self, column: pd.Series, arrays=None):
+        self.column = column
+        # Missing values get code -1, which indexes the last lookup slot
+        if self.categorical:
+            self.codes = column.cat.codes.to_numpy()
+            self.uniques = column.cat.categories
+        elif arrays is not None:
+            self.codes = arrays["codes"]
+            self.uniques = pd.Index(arrays["uniques"])
+        else:
+            codes, uniques = pd.factorize(column)
+            self.codes = codes.astype(_smallest_int(len(uniques)))
+            self.uniques = pd.Index(uniques)
+
+        if arrays is not None:
+            self.positions, self.offsets = arrays["positions"], arrays["offsets"]
+            return
+        # Codes of 16 bits or fewer are sorted by radix sort, in linear time
+        self.positions = np.argsort(self.codes, kind="stable").astype(
+            _smallest_int(len(column)))
+        self.offsets = np.searchsorted(
+            self.codes[self.positions],
+            np.arange(-1, len(self.uniques) + 1)
+        )
+
+    @property
+    def categorical(self) -> bool:
+        return isinstance(self.column.dtype, pd.CategoricalDtype)
+
+    @property
+    def nbytes(self) -> int:
+        """Return the bytes of the arrays the index holds on its own"""
+        return sum(array.nbytes for array in self.arrays().values())
+
+    def arrays(self) -> dict:
+        """Return the arrays the index holds on its own, by name"""
+        arrays = {"positions": self.positions, "offsets": self.offsets}
+        if not self.categorical:
+            arrays["codes"] = self.codes
+            arrays["uniques"] = self.uniques.to_numpy()
+        return arrays
+
+    def present(self) -> pd.Index:
+        """Return the values found in the column, which may lack categories"""
+        return self.uniques[np.diff(self.offsets)[1:] > 0]
+
+    def lookup(self, values) -> np.ndarray:
+        """Return a boolean array of selected codes (missing values last)"""
+        values = pd.Index(values)
+        return np.append(self.uniques.isin(values), values.hasnans)
+
+    def count(self, lookup) -> int:
+        starts, ends = self._bounds(lookup)
+        return int((ends - starts).sum())
+
+    def rows(self, lookup) -> np.ndarray:
+        starts, ends = self._bounds(lookup)
+        return np.concatenate(
+            [self.positions[start:end] for start, end in zip(starts, ends)]
+            + [np.array([], dtype=self.positions.dtype)]
+        )
+
+    def _bounds(self, lookup):
+        # Shift the code slots by one so that -1 (missing) lands on offsets[0]
+        selected = np.roll(lookup, 1).nonzero()[0]
+        return self.offsets[selected], self.offsets[selected + 1]
+
+_SUBSET_DIMENSIONS = ["State", "Year", "Sector", "Source"]
+_SUBSET_INDEXES = {}
+
+def _subset_index(df) -> dict:
+    """Return the per-dimension indexes of df, building them on first use
+
+    An index is rebuilt when a dimension column is replaced, but not when
+    its values are written in place: datasets must not be modified in place
+    once they have been subset.
+    """
+    indexes = _SUBSET_INDEXES.get(id(df))
+    if indexes is None or any(df[column] is not indexes[column].column
+                              for column in _SUBSET_DIMENSIONS):
+        indexes = _store_subset_index(df, {column: _DimensionIndex(df[column])
+                                           for column in _SUBSET_DIMENSIONS})
+    return indexes
+
+def _store_subset_index(df, indexes) -> dict:
+    key = id(df)
+    _SUBSET_INDEXES[key] = indexes
+    weakref.finalize(df, _SUBSET_INDEXES.pop, key, None)
+    return indexes
+
+def subset_index_arrays(df) -> dict:
+    """Return the arrays of the subset indexes of df, named "<column>.<array>"
+
+    Categorical columns are indexed by their own codes, which are left out.
+    """
+    return {
+        f"{column}.{name}": array
+        for column, index in _subset_index(df).items()
+        for name, array in index.arrays().items()
+    }
+
+def attach_subset_index(df, arrays) -> None:
+    """Make the subset_index_arrays of a frame equal to df the indexes of df
+
+    The arrays are used as they are, so memory maps stay shared.
+    """
+    _store_subset_index(df, {
+        column: _DimensionIndex(df[column], {
+            name.split(".", 1)[1]: array
+            for name, array in arrays.items() if name.split(".", 1)[0] == column
+        })
+        for column in _SUBSET_DIMENSIONS
+    })
+
+def subset_values(df) -> dict:
+    """Return the sorted distinct values of each subset dimension of df"""
+    return {
+        column: index.present().dropna().sort_values().tolist()
+        for column, index in _subset_index(df).items()
+    }
+
+@metrics.instrument("prep")
 def data_subset(df, states=None, years=None, sectors=None, sources=None) -> pd.DataFrame:
-    all_states = df["State"].unique()
-    all_years = df["Year"].unique()
-    all_sectors = df["Sector"].unique()
-    all_sources = df["Source"].unique()
-
-    states = _determine_subset_list(states, all_states)
-    years = _determine_subset_list(years, all_years)
-    sectors = _determine_subset_list(sectors, all_sectors)
-    sources = _determine_subset_list(sources, all_sources)
-
-    masks = [
-        df["State"].isin(states),
-        df["Year"].isin(years),
-        df["Sector"].isin(sectors),
-        df["Source"].isin(sources)
+    return df.iloc[subset_rows(df, states, years, sectors, sources)]
+
+def subset_rows(df, states=None, years=None, sectors=None, sources=None) -> np.ndarray:
+    """Return the positions of the rows data_subset selects, in order"""
+    indexes = _subset_index(df)
+    selections = zip(_SUBSET_DIMENSIONS, [states, years, sectors, sources])
+
+    lookups = [
+        (indexes[column], indexes[column].lookup(_determine_subset_list(arg)))
+        for column, arg in selections if arg is not None
     ]
-    final_mask = [all(row) for row in zip(*masks)]
+    if not lookups:
+        return np.arange(len(df))
 
-    return df[final_mask]
+    # Start from the rows of the narrowest dimension and filter the rest
+    lookups.sort(key=lambda item: item[0].count(item[1]))
+    index, lookup = lookups[0]
+    rows = np.sort(index.rows(lookup))
+    for index, lookup in lookups[1:]:
+        rows = rows[lookup[index.codes[rows]]]
+    return rows
 
-def load_dataset():
-    """Return a DataFrame with all of the mapped data"""
-    df = pd.read_csv(os.path.join("data", "use_all_btu.csv"))
+# Filtering out rows that aren't related to consumption
+CONSUMPTION_SECTOR_CODES = ["AC", "CC", "IC", "RC",
+                            "TC", "AP", "IP", "CP", "RP", "TP"]
+EXCLUDED_ENERGY_CODES = ["TN", "TP", "P1"]
 
-    state_abbr_map = map_from_csv(os.path.join("data", "states.csv"))
-    energy_codes_map = map_from_csv(os.path.join("data", "energy_codes.csv"))
-    sector_codes_map = map_from_csv(os.path.join("data", "sector_codes.csv"))
-    unit_codes_map = map_from_csv(os.path.join("data", "unit_codes.csv"))
-    # state_color_map = map_from_csv(r"data\state_plot_colors.csv")
+def consumption_msns(msns) -> np.ndarray:
+    """Return whether each of msns is a consumption series"""
+    return msn_dimensions(msns)["Consumption"].to_numpy()
+
+def _kept_rows(df, keep) -> pd.DataFrame:
+    msns = df["MSN"].unique()
+    return df[df["MSN"].isin(msns[keep(msns)])]
+
+def read_rows(fpath, keep, chunksize=None) -> pd.DataFrame:
+    """Return the rows of a wide SEDS file whose MSN keep selects
+
+    keep(msns) returns whether to keep each of the distinct MSNs msns.
 
-    df = create_code_columns(df)
-    df.loc[df["Sector_code"] == "ET", "Sector_code"] = "TC"
+    With chunksize, the file is read that many rows at a time and each chunk
+    is filtered before the next one is read, so peak memory is bounded by
+    the rows kept rather than the size of the file.
+    """
+    if chunksize is None:
+        chunks = [pd.read_csv(fpath)]
+    else:
+        chunks = pd.read_csv(fpath, chunksize=chunksize)
+    return pd.concat([_kept_rows(chunk, keep) for chunk in chunks])
+
+def read_consumption_rows(fpath=None, chunksize=None) -> pd.DataFrame:
+    """Return the consumption rows of a wide SEDS file"""
+    return read_rows(fpath or SEDS_PATH, consumption_msns, chunksize)
+
+def load_dataset(categorical=False, downcast=False, chunksize=None, fpath=None):
+    """Return a DataFrame with all of the mapped data
+
+    categorical stores the dimension columns as categories and Year as a
+    small integer, downcast stores BTU as float32 (lossy). chunksize streams
+    the file through read_consumption_rows.
+    """
+    return ingest_rows(read_consumption_rows(fpath, chunksize), categorical, downcast)
 
-    df = df.rename(columns={"State": "Abbreviation"})
+def year_columns(rows) -> list:
+    """Return the year columns of wide SEDS rows"""
+    return [column for column in rows.columns if column.isdigit()]
+
+def msn_dimensions(msns) -> pd.DataFrame:
+    """Return the decoded codes, names and flags of each MSN, indexed by MSN
+
+    Decoding the distinct MSNs of a file, a few hundred of them, instead of
+    its rows leaves ingestion a single integer join per dimension.
+    """
+    table = create_code_columns(pd.DataFrame({"MSN": msns}))
+    table.loc[table["Sector_code"] == "ET", "Sector_code"] = "TC"
 
     # Mapping codes to full values
-    df["State"] = df["Abbreviation"].map(state_abbr_map)
-    df["Source"] = df["Energy_code"].map(energy_codes_map)
-    df["Sector"] = df["Sector_code"].map(sector_codes_map)
-    df["Unit"] = df["Unit_code"].map(unit_codes_map)
+    table["Source"] = table["Energy_code"].map(code_map(ENERGY_CODES_PATH))
+    table["Sector"] = table["Sector_code"].map(code_map(SECTOR_CODES_PATH))
+    table["Unit"] = table["Unit_code"].map(code_map(UNIT_CODES_PATH))
 
+    # Dropping MSN's that don't end in B (GDP, generation and the units of
+    # the other SEDS tables)
+    table["Consumption"] = (table["Unit_code"] == "B") \
+        & table["Sector_code"].isin(CONSUMPTION_SECTOR_CODES) \
+        & ~table["Energy_code"].isin(EXCLUDED_ENERGY_CODES)
+    table["Per_capita"] = table["Sector"].str.contains("per capita", na=False)
     # Setting million BTU columns
-    per_capita_rows = df["Sector"].str.contains("per capita")
-    df.loc[per_capita_rows, "Unit"] = "Million BTU"
+    table.loc[table["Per_capita"], "Unit"] = "Million BTU"
+    return table.set_index("MSN")
+
+def _joined(codes, values, categorical):
+    """Return the values of each distinct code expanded to the rows of codes"""
+    if categorical:
+        values = pd.Categorical(values)
+        return pd.Categorical.from_codes(values.codes[codes], values.categories)
+    return np.asarray(values, dtype=object)[codes]
+
+def ingest_rows(df, categorical=False, downcast=False) -> pd.DataFrame:
+    """Return wide SEDS consumption rows mapped and melted into the dataset"""
+    # state_color_map = map_from_csv(r"data\state_plot_colors.csv")
+
+    # Rows only carry the integer code of their state and MSN from here on
+    state_codes, abbreviations = pd.factorize(df["State"])
+    msn_codes, msns = pd.factorize(df["MSN"])
+    states = pd.Index(abbreviations).map(code_map(STATES_PATH))
+    dimensions = msn_dimensions(msns)
 
     # Remove non-state entities
     # not_states = ["US", "DC"]
     # df = df[~df["Abbreviation"].isin(not_states)]
 
-    # Dropping MSN's that don't end in B (GDP and generation)
-    df = df[~df["MSN"].str[-1].isin(["X", "R"])]
+    # Melting by hand: the rows of each year in turn, their codes repeated
+    years = year_columns(df)
+    state_codes, msn_codes = np.tile(state_codes, len(years)), np.tile(msn_codes, len(years))
+    df = pd.DataFrame({
+        "State": _joined(state_codes, states, categorical),
+        **{column: _joined(msn_codes, dimensions[column], categorical)
+           for column in ["Source", "Sector", "Unit"]},
+        "Year": np.repeat(np.array([int(year) for year in years], dtype=np.int64), len(df)),
+        "BTU": df[years].to_numpy().ravel(order="F"),
+    })
 
-    # Filtering out rows that aren't related to consumption
-    consumption_codes = ["AC", "CC", "IC", "RC",
-                        "TC", "AP", "IP", "CP", "RP", "TP"]
+    return compact_dataset(df, categorical, downcast)
 
-    df = df[df["Sector_code"].isin(consumption_codes)]
-    df = df[~df["Energy_code"].isin(["TN", "TP", "P1"])]
+DIMENSION_COLUMNS = ["State", "Source", "Sector", "Unit"]
 
-    # Remove MSN code names
-    df = df.drop(columns=["Data_Status", "MSN", "Abbreviation",
-                        "Energy_code", "Sector_code", "Unit_code"])
+def compact_dataset(df, categorical=True, downcast=False) -> pd.DataFrame:
+    """Return df with memory-compact dimension and numeric columns"""
+    if categorical:
+        for column in DIMENSION_COLUMNS:
+            df[column] = df[column].astype("category")
+        df["Year"] = pd.to_numeric(df["Year"], downcast="integer")
+    if downcast:
+        df["BTU"] = df["BTU"].astype("float32")
+    return df
 
-    id_vars = ["State", "Source", "Sector", "Unit"]
-    df = df.melt(id_vars=id_vars, var_name="Year", value_name="BTU")
+def concat_datasets(frames) -> pd.DataFrame:
+    """Concatenate frames, keeping categorical columns categorical
 
-    df["Year"] = df["Year"].astype(int)
+    pandas falls back to object columns when the categories differ, so the
+    categories are first widened to their sorted union.
+    """
+    frames = list(frames)
+    for column in frames[0].columns:
+        if not all(isinstance(df[column].dtype, pd.CategoricalDtype) for df in frames):
+            continue
+        categories = sorted(set().union(*(df[column].cat.categories for df in frames)))
+        frames = [
+            df.assign(**{column: df[column].cat.set_categories(categories)})
+            for df in frames
+        ]
+    return pd.concat(frames, ignore_index=True)
 
-    return df
+def memory_footprint(df) -> int:
+    """Return the number of bytes held by df, including Python strings"""
+    return int(df.memory_usage(deep=True).sum())
 
-def load_primary_energy_sources(df):
+def load_primary_energy_sources(df, categorical=False, downcast=False):
     df = data_subset(
             df,
             sources=[
@@ -105,7 +362,8 @@ def load_primary_energy_sources(df):
                 "Coal", "Nuclear electric power",
                 "All petroleum products - excluding biofuels"
             ]
-    )
+    # A copy, so the columns set below don't write to a slice of df
+    ).copy()
     df["Source"] = df["Source"].replace(
         {
             "Renewable energy": "Renewables",
@@ -115,4 +373,48 @@ def load_primary_energy_sources(df):
         },
         regex = False
     )
+    if categorical or downcast:
+        df = compact_dataset(df, categorical, downcast)
+    for column in DIMENSION_COLUMNS:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            categories = df[column].cat.remove_unused_categories()
+            df[column] = categories.cat.reorder_categories(
+                sorted(categories.cat.categories))
     return df
+
+def dataset_key(**options) -> str:
+    """Return a hash of the SEDS file, the code tables and options"""
+    return dataset_cache.input_key(
+        [SEDS_PATH, STATES_PATH, ENERGY_CODES_PATH, SECTOR_CODES_PATH, UNIT_CODES_PATH],
+        **options
+    )
+
+INGEST_CHUNKSIZE = 5_000
+
+def _read_dataset(categorical, downcast, on_rows):
+    rows = read_consumption_rows(chunksize=INGEST_CHUNKSIZE)
+    if on_rows is not None:
+        on_rows(rows)
+    return ingest_rows(rows, categorical, downcast)
+
+def load_datasets(categorical=False, downcast=False, use_cache=True, on_rows=None):
+    """Return the mapped dataset and its primary energy sources
+
+    With use_cache, both frames are read from the on-disk cache when neither
+    the SEDS file nor the code tables have changed since they were written.
+    When the SEDS file is read instead, on_rows(rows) is called with its
+    wide consumption rows.
+    """
+    if not use_cache:
+        df = _read_dataset(categorical, downcast, on_rows)
+        return df, load_primary_energy_sources(df, categorical, downcast)
+
+    key = dataset_key(categorical=categorical, downcast=downcast)
+    df = dataset_cache.read_frame("dataset", key)
+    primary_df = dataset_cache.read_frame("primary", key)
+    if df is None or primary_df is None:
+        df = _read_dataset(categorical, downcast, on_rows)
+        primary_df = load_primary_energy_sources(df, categorical, downcast)
+        dataset_cache.write_frame(df, "dataset", key)
+        dataset_cache.write_frame(primary_df, "primary", key)
+    return df, primary_df
@@ -0,0 +1,108 @@
+# Purpose: on-disk columnar cache of the processed datasets
+
+import hashlib
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = os.path.join("data", "cache")
+
+# Bump whenever the processing pipeline changes its output
+CACHE_FORMAT = 1
+
+def input_key(paths, **options) -> str:
+    """Return a hash of the content of paths and the load options"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(
+        {"format": CACHE_FORMAT, **options}, sort_keys=True).encode())
+    for path in paths:
+        with open(path, "rb") as infile:
+            for chunk in iter(lambda: infile.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+def _cache_path(name, key) -> str:
+    return os.path.join(CACHE_DIR, f"{name}-{key}.npz")
+
+def encode_frame(df) -> dict:
+    """Return df as fixed-width arrays, with column metadata under "meta"
+
+    Categorical and object columns are stored as integer codes plus their
+    categories, numeric columns as they are.
+    """
+    arrays = {}
+    meta = {}
+    # A range index is stored as its bounds, it would take 8 bytes a row
+    if isinstance(df.index, pd.RangeIndex):
+        meta["range"] = [df.index.start, df.index.stop, df.index.step]
+    else:
+        arrays["index"] = np.asarray(df.index)
+    columns = []
+    for i, column in enumerate(df.columns):
+        series = df[column]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            kind = "category"
+            values = series.cat
+            codes, categories = values.codes, values.categories
+        elif series.dtype == object:
+            kind = "object"
+            codes, categories = pd.factorize(series)
+        else:
+            columns.append((column, "values"))
+            arrays[f"{i}.values"] = series.to_numpy()
+            continue
+        columns.append((column, kind))
+        arrays[f"{i}.codes"] = np.asarray(codes)
+        arrays[f"{i}.categories"] = np.asarray(categories, dtype=str)
+    arrays["meta"] = np.array(json.dumps({**meta, "columns": columns}))
+    return arrays
+
+def decode_frame(arrays) -> pd.DataFrame:
+    """Return the frame of encode_frame, reusing the arrays where possible"""
+    meta = json.loads(str(arrays["meta"]))
+    columns = {}
+    for i, (column, kind) in enumerate(meta["columns"]):
+        if kind == "values":
+            columns[column] = arrays[f"{i}.values"]
+            continue
+        values = pd.Categorical.from_codes(
+            arrays[f"{i}.codes"], arrays[f"{i}.categories"].astype(object))
+        columns[column] = values if kind == "category" else np.asarray(values, dtype=object)
+    index = pd.RangeIndex(*meta["range"]) if "range" in meta else pd.Index(arrays["index"])
+    return pd.DataFrame(columns, index=index, copy=False)
+
+def read_frame(name, key):
+    """Return the cached frame for (name, key), or None if there isn't one"""
+    try:
+        arrays = np.load(_cache_path(name, key))
+    except FileNotFoundError:
+        return None
+
+    with arrays:
+        return decode_frame(arrays)
+
+def write_frame(df, name, key) -> None:
+    """Store df as one array per column, replacing older versions of name"""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    arrays = encode_frame(df)
+
+    # Write under a temporary name so concurrent workers never read a
+    # partial file
+    path = _cache_path(name, key)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as outfile:
+        np.savez(outfile, **arrays)
+    os.replace(tmp_path, path)
+
+    for fname in os.listdir(CACHE_DIR):
+        if fname.startswith(f"{name}-") and fname.endswith(".npz") \
+                and fname != os.path.basename(path):
+            os.remove(os.path.join(CACHE_DIR, fname))
+
+def clear() -> None:
+    """Remove every cached frame"""
+    if os.path.isdir(CACHE_DIR):
+        for fname in os.listdir(CACHE_DIR):
+            os.remove(os.path.join(CACHE_DIR, fname))
@@ -0,0 +1,202 @@
+# Purpose: the active dataset version and its incremental refresh
+#
+# Callbacks read the active DatasetVersion once and use its frames for the
+# whole request, so a refresh that swaps in a new SEDS vintage never mixes
+# two vintages in one response. A refresh diffs the consumption rows of the
+# new file against digests of those of the active version, ingests only the
+# years whose values changed and reuses the rows and aggregates of the other
+# years. Only the digests are kept, so no worker holds the wide rows.
+
+from dataclasses import dataclass, field
+import hashlib
+import logging
+import os
+import threading
+import time
+
+import pandas as pd
+
+import data_processing as dp
+import dataset_cache
+import rollups as ro
+
+KEY_COLUMNS = ["State", "MSN"]
+
+logger = logging.getLogger(__name__)
+
+# Compared and hashed by identity, so a version can key a cache
+@dataclass(frozen=True, eq=False)
+class DatasetVersion:
+    """Frames of one SEDS vintage, never modified once built"""
+    key: str
+    df: pd.DataFrame
+    primary_df: pd.DataFrame
+    # Digests of the consumption rows of the SEDS file, see source_digests
+    digests: dict
+    # Hash of the state and code tables the rows were mapped with
+    tables_key: str = ""
+    options: dict = field(default_factory=dict)
+    years: list = field(init=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "years", sorted(int(year) for year in self.df["Year"].unique()))
+
+def _tables_key() -> str:
+    return dataset_cache.input_key([dp.STATES_PATH, dp.ENERGY_CODES_PATH,
+                                    dp.SECTOR_CODES_PATH, dp.UNIT_CODES_PATH])
+
+def _digest(values) -> str:
+    return hashlib.sha256(
+        pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes()).hexdigest()
+
+def source_digests(rows) -> dict:
+    """Return digests of the key columns and of each year column of wide
+    SEDS rows, in the order of the columns"""
+    digests = {"keys": _digest(rows[KEY_COLUMNS])}
+    for year in dp.year_columns(rows):
+        digests[year] = _digest(rows[year])
+    return digests
+
+def _write_digests(digests, key) -> None:
+    dataset_cache.write_frame(
+        pd.DataFrame({"column": list(digests), "digest": list(digests.values())}),
+        "digests", key)
+
+def cache_digests(rows, categorical=True, downcast=False) -> None:
+    """Cache the digests of rows just read from the current SEDS file
+
+    Passed as on_rows to dp.load_datasets, it spares from_frames reading
+    the file a second time.
+    """
+    _write_digests(source_digests(rows), dp.dataset_key(categorical=categorical,
+                                                        downcast=downcast))
+
+def _read_digests(key) -> dict:
+    """Return the source digests of the dataset with key, cached on disk"""
+    frame = dataset_cache.read_frame("digests", key)
+    if frame is None:
+        digests = source_digests(dp.read_consumption_rows(chunksize=dp.INGEST_CHUNKSIZE))
+        _write_digests(digests, key)
+        return digests
+    return dict(zip(frame["column"], frame["digest"]))
+
+def from_frames(df, primary_df, categorical=True, downcast=False) -> DatasetVersion:
+    """Return the version of frames loaded from the current SEDS file"""
+    options = {"categorical": categorical, "downcast": downcast}
+    key = dp.dataset_key(**options)
+    return DatasetVersion(key, df, primary_df, _read_digests(key), _tables_key(), options)
+
+def load(categorical=True, downcast=False) -> DatasetVersion:
+    """Return the version of the current SEDS file"""
+    df, primary_df = dp.load_datasets(
+        categorical, downcast,
+        on_rows=lambda rows: cache_digests(rows, categorical, downcast))
+    return from_frames(df, primary_df, categorical, downcast)
+
+def changed_years(old_digests, new_digests) -> list:
+    """Return the years of new_digests whose values differ from old_digests
+
+    Rows are compared in order, so a vintage that adds, drops or reorders
+    rows changes every year.
+    """
+    new_years = [year for year in new_digests if year != "keys"]
+    if old_digests["keys"] != new_digests["keys"]:
+        return [int(year) for year in new_years]
+    return [int(year) for year in new_years if old_digests.get(year) != new_digests[year]]
+
+def refreshed(old, rows, key, tables_key) -> DatasetVersion:
+    """Return the version of the wide consumption rows, built from old
+
+    Only the changed years are mapped and melted, the rows of the other
+    years are taken from old's frames and so are their aggregates. New state
+    or code tables change every year.
+    """
+    digests = source_digests(rows)
+    if tables_key != old.tables_key:
+        years = [int(year) for year in dp.year_columns(rows)]
+    else:
+        years = changed_years(old.digests, digests)
+    if not years and list(old.digests) == list(digests):
+        return DatasetVersion(key, old.df, old.primary_df, digests, tables_key, old.options)
+
+    kept_years = [int(year) for year in dp.year_columns(rows) if int(year) not in years]
+    unchanged = [str(year) for year in kept_years]
+    changed_df = dp.ingest_rows(rows.drop(columns=unchanged), **old.options)
+    changed_primary = dp.load_primary_energy_sources(changed_df, **old.options)
+    df = _by_year(dp.concat_datasets(
+        [dp.data_subset(old.df, years=kept_years), changed_df]))
+    primary_df = _by_year(dp.concat_datasets(
+        [dp.data_subset(old.primary_df, years=kept_years), changed_primary]))
+
+    ro.refresh_rollups(old.primary_df, df, primary_df, years)
+    return DatasetVersion(key, df, primary_df, digests, tables_key, old.options)
+
+def _by_year(df) -> pd.DataFrame:
+    """Return df in year order, the order a full load produces"""
+    # Already so when only years after the kept ones changed
+    if df["Year"].is_monotonic_increasing:
+        return df
+    return df.sort_values("Year", kind="stable", ignore_index=True)
+
+_active = None
+_listeners = []
+_refresh_lock = threading.Lock()
+
+def current() -> DatasetVersion:
+    """Return the active version; read it once per request"""
+    return _active
+
+def activate(version) -> None:
+    """Make version the active one and notify the swap listeners"""
+    global _active
+    previous, _active = _active, version
+    if previous is not None and previous is not version:
+        for listener in _listeners:
+            listener(previous, version)
+
+def on_swap(listener):
+    """Call listener(previous, version) whenever the active version changes"""
+    _listeners.append(listener)
+    return listener
+
+def refresh() -> DatasetVersion:
+    """Load the current SEDS file into a new active version if it changed"""
+    with _refresh_lock:
+        old = current()
+        key = dp.dataset_key(**old.options)
+        if key == old.key:
+            return old
+        rows = dp.read_consumption_rows(chunksize=dp.INGEST_CHUNKSIZE)
+        version = refreshed(old, rows, key, _tables_key())
+        activate(version)
+        # Cached so that restarted workers load the new vintage directly
+        dataset_cache.write_frame(version.df, "dataset", key)
+        dataset_cache.write_frame(version.primary_df, "primary", key)
+        _write_digests(version.digests, key)
+        return version
+
+def _input_stats() -> tuple:
+    return tuple((stat.st_mtime_ns, stat.st_size)
+                 for stat in map(os.stat, [dp.SEDS_PATH, dp.STATES_PATH]))
+
+def watch(interval) -> threading.Thread:
+    """Refresh whenever the SEDS file changes, checking every interval seconds"""
+    def poll():
+        stats = _input_stats()
+        while True:
+            time.sleep(interval)
+            try:
+                latest = _input_stats()
+                if latest != stats:
+                    refresh()
+                    stats = latest
+            except (pd.errors.ParserError, pd.errors.EmptyDataError, OSError):
+                # A file caught mid-copy is retried at the next check
+                pass
+            except Exception:
+                # Retried only once the files change again
+                logger.exception("Refreshing the dataset failed")
+                stats = latest
+    thread = threading.Thread(target=poll, name="dataset-watch", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,130 @@
+# Purpose: bounded cache of serialized figures for the Dash callbacks
+
+from collections import OrderedDict
+import itertools
+import os
+import threading
+import weakref
+
+import pandas as pd
+
+import metrics
+import serialization
+
+POLICIES = ["lru", "fifo"]
+
+_frame_tokens = {}
+_token_counter = itertools.count()
+_caches = weakref.WeakSet()
+
+def frame_token(df) -> int:
+    """Return a number identifying df for as long as it is alive
+
+    Figures cached for a frame are dropped from every cache once the frame
+    is garbage collected, so a reloaded dataset never serves stale figures.
+    """
+    token = _frame_tokens.get(id(df))
+    if token is None:
+        token = next(_token_counter)
+        _frame_tokens[id(df)] = token
+        weakref.finalize(df, _forget_frame, id(df), token)
+    return token
+
+def _forget_frame(frame_id, token) -> None:
+    _frame_tokens.pop(frame_id, None)
+    for cache in list(_caches):
+        cache.invalidate(token)
+
+@metrics.instrument("serialization")
+def _to_json(fig) -> str:
+    return serialization.figure_to_json(fig)
+
+@metrics.instrument("serialization")
+def _from_json(figure_json) -> dict:
+    return serialization.loads(figure_json)
+
+def _arg_key(arg):
+    if isinstance(arg, pd.DataFrame):
+        return ("frame", frame_token(arg))
+    return arg
+
+class FigureCache:
+    """Bounded mapping of (builder, arguments) to serialized figures
+
+    policy is "lru" to evict the least recently used figure or "fifo" to
+    evict the oldest one. Arguments other than DataFrames must be hashable.
+    """
+
+    def __init__(self, maxsize=256, policy="lru"):
+        if policy not in POLICIES:
+            raise ValueError(f"policy must be one of {POLICIES}, not {policy!r}")
+        self.maxsize = maxsize
+        self.policy = policy
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+        _caches.add(self)
+
+    def get_json(self, build, *args) -> str:
+        """Return the JSON of build(*args), building it on a miss"""
+        key = (build.__module__, build.__qualname__, *(_arg_key(arg) for arg in args))
+        with self._lock:
+            figure_json = self._figures.get(key)
+            if figure_json is not None:
+                self.hits += 1
+                if self.policy == "lru":
+                    self._figures.move_to_end(key)
+                return figure_json
+            self.misses += 1
+
+        figure_json = _to_json(build(*args))
+
+        with self._lock:
+            self._figures[key] = figure_json
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+                self.evictions += 1
+        return figure_json
+
+    def get(self, build, *args) -> dict:
+        """Return build(*args) as a figure dict, building it on a miss"""
+        return _from_json(self.get_json(build, *args))
+
+    def resize(self, maxsize) -> None:
+        """Bound the cache to maxsize figures, evicting the excess now"""
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, token=None) -> None:
+        """Drop the figures of the frame with token, or every figure"""
+        with self._lock:
+            if token is None:
+                self._figures.clear()
+                return
+            stale = [key for key in self._figures if ("frame", token) in key]
+            for key in stale:
+                del self._figures[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._figures),
+                "maxsize": self.maxsize,
+                "policy": self.policy,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+# Unless FIGURE_CACHE_SIZE is set, app.py sizes the cache to every figure
+# its dataset can show
+FIGURE_CACHE_SIZE = os.environ.get("FIGURE_CACHE_SIZE")
+FIGURE_CACHE = FigureCache(
+    maxsize=int(FIGURE_CACHE_SIZE or 256),
+    policy=os.environ.get("FIGURE_CACHE_POLICY", "lru")
+)
@@ -0,0 +1,80 @@
+# Purpose: read-only on-disk store of pre-rendered figure JSON
+
+import json
+import os
+
+import pandas as pd
+
+import metrics
+import serialization
+
+STORE_DIR = os.path.join("data", "prerendered")
+MANIFEST_FNAME = "manifest.json"
+FIGURES_FNAME = "figures.json"
+
+def figure_key(build, *args) -> str:
+    """Return the store key of build(*args), ignoring DataFrame arguments"""
+    return "|".join([build.__name__] + [
+        str(arg) for arg in args if not isinstance(arg, pd.DataFrame)
+    ])
+
+class FigureStore:
+    """Pre-rendered figures, read from disk on first use"""
+
+    def __init__(self, path=STORE_DIR):
+        with open(os.path.join(path, MANIFEST_FNAME)) as infile:
+            manifest = json.load(infile)
+        self.dataset_key = manifest["dataset_key"]
+        self._offsets = manifest["figures"]
+        self._figures_path = os.path.join(path, FIGURES_FNAME)
+        self._figures = {}
+
+    def __contains__(self, key) -> bool:
+        return key in self._offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def get_json(self, key) -> str:
+        figure_json = self._figures.get(key)
+        if figure_json is None:
+            offset, length = self._offsets[key]
+            with open(self._figures_path, "rb") as infile:
+                infile.seek(offset)
+                figure_json = infile.read(length).decode()
+            self._figures[key] = figure_json
+        return figure_json
+
+    @metrics.instrument("serialization")
+    def get(self, key) -> dict:
+        return serialization.loads(self.get_json(key))
+
+def write_store(figures, dataset_key, path=STORE_DIR) -> int:
+    """Write the (key, figure JSON) pairs of figures and return their count"""
+    os.makedirs(path, exist_ok=True)
+    manifest_path = os.path.join(path, MANIFEST_FNAME)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+    offsets = {}
+    with open(os.path.join(path, FIGURES_FNAME), "wb") as outfile:
+        for key, figure_json in figures:
+            data = figure_json.encode()
+            offsets[key] = [outfile.tell(), len(data)]
+            outfile.write(data)
+            outfile.write(b"\n")
+
+    # The manifest goes last so a partial build is never picked up
+    with open(manifest_path, "w") as outfile:
+        json.dump({"dataset_key": dataset_key, "figures": offsets}, outfile)
+    return len(offsets)
+
+def open_store(dataset_key, path=STORE_DIR):
+    """Return the store at path if it was built from dataset_key, else None"""
+    try:
+        store = FigureStore(path)
+    except FileNotFoundError:
+        return None
+    if store.dataset_key != dataset_key:
+        return None
+    return store
@@ -0,0 +1,49 @@
+# Purpose: figures prebuilt once per chart type, filled in with new data
+#
+# Plotly Express validates its arguments and merges layouts every time it
+# builds a figure, which costs more than the data work at this dataset size.
+# A FigureTemplate keeps the resolved figure of a chart type as plain dicts,
+# so building a figure only copies the parts that change and sets its data.
+
+import threading
+
+def _merged(base, updates) -> dict:
+    """Return a copy of base with updates merged into its nested dicts"""
+    merged = dict(base)
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(base.get(key), dict):
+            value = _merged(base[key], value)
+        merged[key] = value
+    return merged
+
+class FigureTemplate:
+    """Resolved layout and traces of a figure, traces keyed by name"""
+
+    def __init__(self, fig):
+        figure = fig.to_plotly_json()
+        self.layout = figure["layout"]
+        self.traces = {trace.get("name", ""): trace for trace in figure["data"]}
+
+    def __contains__(self, name) -> bool:
+        return name in self.traces
+
+    def trace(self, name="", **updates) -> dict:
+        return _merged(self.traces[name], updates)
+
+    def figure(self, traces, **layout) -> dict:
+        """Return a figure dict of traces with layout merged into the template's"""
+        return {"data": traces, "layout": _merged(self.layout, layout)}
+
+_templates = {}
+_lock = threading.Lock()
+
+def template(build, *args) -> FigureTemplate:
+    """Return the template of the figure build(*args), building it once"""
+    key = (build, *args)
+    with _lock:
+        cached = _templates.get(key)
+    if cached is None:
+        cached = FigureTemplate(build(*args))
+        with _lock:
+            cached = _templates.setdefault(key, cached)
+    return cached
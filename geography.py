@@ -0,0 +1,159 @@
+# Purpose: simplified, quantized variants of the United States GeoJSON
+# Usage: python geography.py (rebuilds the variants in data/)
+
+import functools
+import json
+import math
+import os
+
+GEOJSON_PATH = os.path.join("data", "united_states.geojson")
+
+# Variant name: (simplification tolerance in degrees, decimal places kept)
+GEOJSON_VARIANTS = {
+    "fine": (0.01, 3),
+    "medium": (0.03, 3),
+    "coarse": (0.1, 2),
+}
+
+# Size of a mapbox tile in pixels
+TILE_SIZE = 512
+
+def variant_path(variant) -> str:
+    root, ext = os.path.splitext(GEOJSON_PATH)
+    return f"{root}.{variant}{ext}"
+
+@functools.lru_cache(maxsize=None)
+def load_geojson(variant=None) -> dict:
+    """Return the GeoJSON of variant, or the full resolution one if None"""
+    fpath = GEOJSON_PATH if variant is None else variant_path(variant)
+    with open(fpath) as infile:
+        return json.load(infile)
+
+def variant_for_zoom(zoom):
+    """Return the coarsest variant that is still sub-pixel at zoom"""
+    degrees_per_pixel = 360/(TILE_SIZE*2**zoom)
+    fitting = [
+        (tolerance, variant) for variant, (tolerance, _) in GEOJSON_VARIANTS.items()
+        if tolerance <= degrees_per_pixel/2 and os.path.exists(variant_path(variant))
+    ]
+    return max(fitting)[1] if fitting else None
+
+def geojson_for_zoom(zoom) -> dict:
+    return load_geojson(variant_for_zoom(zoom))
+
+def _distance(point, start, end) -> float:
+    """Return the distance of point from the segment start-end"""
+    (x, y), (x1, y1), (x2, y2) = point, start, end
+    dx, dy = x2 - x1, y2 - y1
+    if dx == 0 and dy == 0:
+        return math.hypot(x - x1, y - y1)
+    t = max(0, min(1, ((x - x1)*dx + (y - y1)*dy)/(dx*dx + dy*dy)))
+    return math.hypot(x - (x1 + t*dx), y - (y1 + t*dy))
+
+def _douglas_peucker(points, tolerance) -> list:
+    keep = [False]*len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_distance, index = 0, None
+        for i in range(first + 1, last):
+            distance = _distance(points[i], points[first], points[last])
+            if distance > max_distance:
+                max_distance, index = distance, i
+        if index is not None and max_distance > tolerance:
+            keep[index] = True
+            stack.extend([(first, index), (index, last)])
+    return [point for point, kept in zip(points, keep) if kept]
+
+def _junctions(rings) -> set:
+    """Return the points where borders shared by several rings meet"""
+    neighbours = {}
+    for ring in rings:
+        points = ring[:-1]
+        for i, point in enumerate(points):
+            pair = frozenset([points[i - 1], points[(i + 1) % len(points)]])
+            neighbours.setdefault(point, set()).add(pair)
+    return {point for point, pairs in neighbours.items() if len(pairs) > 1}
+
+def _simplify_ring(ring, junctions, tolerance, arcs) -> list:
+    if len(ring) < 4:
+        return ring
+    points = ring[:-1]
+    # Rings without junctions start from their lowest point so that two
+    # identical rings are split the same way
+    cuts = [i for i, point in enumerate(points) if point in junctions] \
+        or [points.index(min(points))]
+
+    # Rotate the ring to start at a junction and split it into arcs there
+    points = points[cuts[0]:] + points[:cuts[0]] + [points[cuts[0]]]
+    cuts = [cut - cuts[0] for cut in cuts] + [len(points) - 1]
+
+    simplified = [points[0]]
+    for start, end in zip(cuts, cuts[1:]):
+        arc = tuple(points[start:end + 1])
+        # A border shared by two rings is walked in opposite directions, so
+        # simplify it in one canonical direction to get the same result
+        reverse = arc[::-1] < arc
+        key = arc[::-1] if reverse else arc
+        if key not in arcs:
+            arcs[key] = _douglas_peucker(list(key), tolerance)
+        arc = arcs[key][::-1] if reverse else arcs[key]
+        simplified.extend(arc[1:])
+    return simplified
+
+def simplify_geojson(geojson, tolerance, precision) -> dict:
+    """Return geojson with its coordinates rounded to precision decimal places
+    and its borders simplified to within tolerance degrees
+
+    Borders shared by neighbouring states are simplified identically, so the
+    simplified states still tile without gaps or overlaps.
+    """
+    def quantize(ring):
+        points = [(round(x, precision), round(y, precision)) for x, y in ring]
+        # Rounding can collapse neighbouring points into one
+        return [point for i, point in enumerate(points) if i == 0 or point != points[i - 1]]
+
+    features = []
+    for feature in geojson["features"]:
+        geometry = feature["geometry"]
+        polygons = geometry["coordinates"]
+        if geometry["type"] == "Polygon":
+            polygons = [polygons]
+        features.append((feature, [[quantize(ring) for ring in polygon] for polygon in polygons]))
+
+    junctions = _junctions(ring for _, polygons in features for polygon in polygons for ring in polygon)
+    arcs = {}
+    simplified_features = []
+    for feature, polygons in features:
+        simplified_polygons = []
+        for polygon in polygons:
+            rings = [_simplify_ring(ring, junctions, tolerance, arcs) for ring in polygon]
+            # Drop islands and holes that collapse below the tolerance
+            if len(rings[0]) >= 4:
+                simplified_polygons.append([ring for ring in rings if len(ring) >= 4])
+        if not simplified_polygons:
+            simplified_polygons = [polygons[0]]
+        simplified_features.append({
+            "type": "Feature",
+            "properties": feature["properties"],
+            "geometry": {
+                "type": "MultiPolygon",
+                "coordinates": [[[list(point) for point in ring] for ring in polygon]
+                                for polygon in simplified_polygons]
+            }
+        })
+    return {"type": "FeatureCollection", "features": simplified_features}
+
+def main():
+    geojson = load_geojson()
+    full_size = os.path.getsize(GEOJSON_PATH)
+    for variant, (tolerance, precision) in GEOJSON_VARIANTS.items():
+        simplified = simplify_geojson(geojson, tolerance, precision)
+        with open(variant_path(variant), "w") as outfile:
+            json.dump(simplified, outfile, separators=(",", ":"))
+        size = os.path.getsize(variant_path(variant))
+        print(f"{variant:<8}{size/1000:>8.0f} kB ({size/full_size:.0%} of full resolution)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,22 @@
+# Purpose: gunicorn settings, read from the working directory on startup
+#
+# The master imports the app once, loading the dataset and building the
+# figure templates, then forks the workers. They share that memory with the
+# master copy-on-write instead of each loading their own copy.
+
+import gc
+import os
+
+preload_app = True
+
+# Tells app.py it is being imported by the master
+os.environ["APP_PRELOAD"] = "1"
+
+def pre_fork(server, worker):
+    # Objects the master built are never collected, so the collector of a
+    # worker doesn't write to their pages and copy them
+    gc.freeze()
+
+def post_fork(server, worker):
+    import app
+    app.start_background_work()
@@ -0,0 +1,162 @@
+# Purpose: latency and payload histograms for the Dash callbacks
+#
+# Set APP_METRICS=1 to enable. Disabled, instrument() returns functions
+# unchanged and init_app() registers nothing, so there is no overhead.
+# Enabled, the histograms are served in the Prometheus text format at
+# /metrics and every callback response carries a Server-Timing header.
+
+import functools
+import os
+import threading
+import time
+
+import flask
+
+ENABLED = os.environ.get("APP_METRICS", "") not in ("", "0")
+
+# Phases of a callback request. Each records the time spent in it exclusive
+# of nested phases; dispatch is what is left of the request (Dash decoding
+# the request and encoding the response).
+PHASES = ["prep", "figure", "serialization", "dispatch"]
+
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+class Histogram:
+    """Prometheus-style histogram with cumulative buckets per label set"""
+
+    def __init__(self, name, description, label_names, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels) -> None:
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Per bucket counts, then the count and sum of observations
+                series = self._series[labels] = [0]*len(self.buckets) + [0, 0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+        for labels, values in series:
+            label_text = ",".join(f'{name}="{value}"' for name, value in zip(self.label_names, labels))
+            prefix = f"{label_text}," if label_text else ""
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound:g}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-2]}')
+            lines.append(f"{self.name}_count{{{label_text}}} {values[-2]}")
+            lines.append(f"{self.name}_sum{{{label_text}}} {values[-1]:.6f}")
+        return lines
+
+CALLBACK_SECONDS = Histogram(
+    "dash_callback_seconds", "Wall time of Dash callback requests", ["callback"])
+PHASE_SECONDS = Histogram(
+    "dash_callback_phase_seconds", "Wall time of Dash callback requests per phase",
+    ["callback", "phase"])
+RESPONSE_BYTES = Histogram(
+    "dash_callback_response_bytes", "Size of Dash callback responses", ["callback"], SIZE_BUCKETS)
+FUNCTION_SECONDS = Histogram(
+    "function_seconds", "Wall time of instrumented functions, nested calls included",
+    ["function", "phase"])
+TABLE_LOAD_SECONDS = Histogram(
+    "seds_table_load_seconds", "Wall time of loading SEDS tables into the registry",
+    ["table", "source"])
+TABLE_EVICTED_BYTES = Histogram(
+    "seds_table_evicted_bytes", "Size of SEDS tables evicted over the memory budget",
+    ["table"], SIZE_BUCKETS)
+HISTOGRAMS = [CALLBACK_SECONDS, PHASE_SECONDS, RESPONSE_BYTES, FUNCTION_SECONDS,
+              TABLE_LOAD_SECONDS, TABLE_EVICTED_BYTES]
+
+# Phase totals and the stack of running instrumented calls of the request
+# being handled on this thread
+_local = threading.local()
+
+def instrument(phase, name=None):
+    """Decorate a function to record its wall time under phase"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+        label = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stack = getattr(_local, "stack", None)
+            if stack is None:
+                stack = _local.stack = []
+            # Time spent in nested instrumented calls
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                phases = getattr(_local, "phases", None)
+                if phases is not None:
+                    phases[phase] += elapsed - nested
+                FUNCTION_SECONDS.observe(elapsed, label, phase)
+        return wrapper
+    return decorator
+
+def render() -> str:
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+def _callback_name(app, output) -> str:
+    callback = app.callback_map.get(output, {}).get("callback")
+    return callback.__name__ if callback is not None else str(output)
+
+def init_app(app) -> None:
+    """Time the callbacks of the Dash app and serve /metrics"""
+    if not ENABLED:
+        return
+    server = app.server
+
+    @server.before_request
+    def _start_timing():
+        if not flask.request.path.endswith("_dash-update-component"):
+            return
+        body = flask.request.get_json(silent=True) or {}
+        flask.g.metrics_callback = _callback_name(app, body.get("output"))
+        flask.g.metrics_start = time.perf_counter()
+        _local.phases = dict.fromkeys(PHASES, 0.0)
+        _local.stack = []
+
+    @server.after_request
+    def _finish_timing(response):
+        start = flask.g.pop("metrics_start", None)
+        if start is None:
+            return response
+        total = time.perf_counter() - start
+        phases = _local.phases
+        _local.phases = None
+        phases["dispatch"] = max(0.0, total - sum(phases.values()))
+
+        callback = flask.g.metrics_callback
+        CALLBACK_SECONDS.observe(total, callback)
+        for phase, seconds in phases.items():
+            PHASE_SECONDS.observe(seconds, callback, phase)
+        RESPONSE_BYTES.observe(response.calculate_content_length() or 0, callback)
+
+        timings = [f"{phase};dur={seconds*1000:.2f}" for phase, seconds in phases.items()]
+        response.headers["Server-Timing"] = ", ".join(timings + [f"total;dur={total*1000:.2f}"])
+        return response
+
+    @server.route("/metrics")
+    def metrics():
+        return flask.Response(render(), mimetype="text/plain; version=0.0.4")
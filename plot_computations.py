@@ -1,44 +1,141 @@
 import datetime
-import json
-import pathlib
-import os
+import functools
 
-import plotly.express as px
 import plotly
-import plotly.io as pio
+import pandas as pd
+# plotly.express is imported by the builders that use it: it pulls in
+# plotly.offline and IPython, a third of a second of every worker's startup
 
-import data_processing as dp
+import figure_templates as ft
+import metrics
 import plotting
 import presidents
-
+import rollups as ro
+
+MAIN_DEPICTIONS = [
+    "Energy consumption",
+    "Energy consumption (per capita)",
+    "Energy consumption (per resource)",
+    "Resource consumption"
+]
+X_AXIS_TYPES = ["Year", "President"]
+STATE_DEPICTIONS = ["Energy consumption", "Energy consumption (per capita)"]
+# The depictions of the main plot, and the sectors of a state
+HISTORY_DEPICTIONS = MAIN_DEPICTIONS + ["Energy consumption (per sector)"]
+
+@metrics.instrument("figure")
 def precompute_main_plots(total_df, primary_df, depiction, x_axis):
-    # depiction_types = ["Energy consumption", "Energy consumption (per capita)", "Energy consumption (per resource)", "Resource consumption"]
-    # x_axis_types = ["Year", "President"]
-
-    # combinations = [[depiction, x_axis] for depiction in depiction_types for x_axis in x_axis_types]
-
-    # figs = {}
-    # for depiction, x_axis in combinations:
     fig = us_total(total_df, primary_df, depiction, x_axis)
-    # figs[depiction + x_axis] = fig
     return fig
 
+# Marker size of the largest bubble in the scatter plots
+SIZE_MAX = 12
+
+@metrics.instrument("figure")
 def us_total(total_df, primary_df, depiction_type, x_axis_type):
-    # Subset the data
-    per_cap_df = dp.data_subset(total_df, states=["United States"], sectors=["Total consumption per capita"], sources=["Total"])
-    consumption_df = dp.data_subset(primary_df, states=["United States"], sectors=["Total"])
+    consumption = ro.consumption_rollup(primary_df)
+    per_cap_df = ro.per_capita_rollup(total_df).us_per_capita
+    return _total_figure(consumption.us_totals, consumption.us_sources, per_cap_df,
+                         depiction_type, x_axis_type)
+
+@metrics.instrument("figure")
+def state_history(total_df, primary_df, state, depiction_type, x_axis_type):
+    """Return the us_total figure of one state, or its end-use sectors"""
+    # Lookups into rollups built once per dataset, no scan of the rows
+    totals = ro.consumption_rollup(primary_df).state_totals.for_state(state)
+    history = ro.state_history_rollup(primary_df).for_state(state)
+    if depiction_type == "Energy consumption (per sector)":
+        return _sectors_figure(totals, history, x_axis_type)
+    per_cap_df = ro.per_capita_rollup(total_df).state_per_capita.for_state(state)
+    return _total_figure(totals, history.sources, per_cap_df, depiction_type, x_axis_type)
+
+def _total_figure(total_df, resource_df, per_cap_df, depiction_type, x_axis_type):
+    """Return the figure of us_total for yearly totals, sources and per capita"""
+    template = ft.template(_us_total_sample, depiction_type, x_axis_type)
 
-    # Prepare the dataset
-    consumption_df["BTU"] = consumption_df["BTU"]/1_000_000
-    consumption_df = consumption_df.rename(columns={"BTU": "Quadrillion BTU"})
-    per_cap_df = per_cap_df.rename(columns={"BTU": "Million BTU"})
+    min_x, max_x, min_y, max_y = calculate_bounds(total_df)
+    if depiction_type in ["Energy consumption", "Energy consumption (per capita)"]:
+        marker_size = _marker_size(per_cap_df).to_numpy()
+        if depiction_type == "Energy consumption":
+            plot_df, y = total_df, "Quadrillion BTU"
+        else:
+            plot_df, y = per_cap_df, "Million BTU"
+            min_x, max_x, min_y, max_y = _per_capita_bounds(per_cap_df)
+        traces = [template.trace(
+            x=plot_df["Year"].to_numpy(),
+            y=plot_df[y].to_numpy(),
+            hovertext=plot_df["Year"].to_numpy(),
+            marker={
+                "color": per_cap_df["Million BTU"].to_numpy(),
+                "size": marker_size,
+                "sizeref": marker_size.max()/SIZE_MAX**2
+            }
+        )]
+    else:
+        if depiction_type == "Energy consumption (per resource)":
+            min_y = 0
+        else:
+            min_x, max_x, min_y, max_y = calculate_bounds(resource_df)
+        traces = _source_traces(template, resource_df, "Year", "Quadrillion BTU")
+        if traces is None:
+            return _us_total_px(total_df, resource_df, per_cap_df, depiction_type, x_axis_type)
+
+    return template.figure(
+        traces,
+        xaxis={"range": [min_x, max_x], "rangeselector": {"buttons": _range_buttons(total_df)}},
+        yaxis={"range": [min_y, max_y]}
+    )
 
-    # Determine the marker size
-    marker_size = (per_cap_df["Million BTU"] /
-                   per_cap_df["Million BTU"].max())**5
+def us_total_px(total_df, primary_df, depiction_type, x_axis_type):
+    """Return us_total built with plotly express"""
+    consumption = ro.consumption_rollup(primary_df)
+    per_cap_df = ro.per_capita_rollup(total_df).us_per_capita
+    return _us_total_px(consumption.us_totals, consumption.us_sources, per_cap_df,
+                        depiction_type, x_axis_type)
+
+def _us_total_sample(depiction_type, x_axis_type):
+    sources = sorted(plotting.ENERGY_SOURCE_COLORS)
+    return _us_total_px(
+        pd.DataFrame({"Year": [1960], "Quadrillion BTU": [1.0]}),
+        pd.DataFrame({"Year": 1960, "Source": sources, "Quadrillion BTU": 1.0}),
+        pd.DataFrame({"Year": [1960], "Million BTU": [1.0]}),
+        depiction_type, x_axis_type
+    )
 
+def _marker_size(per_cap_df):
+    return (per_cap_df["Million BTU"] /
+            per_cap_df["Million BTU"].max())**5
+
+def _year_bounds(df):
+    """Return the first and last year of df as dates"""
+    return (datetime.date(int(df["Year"].min()), 1, 1),
+            datetime.date(int(df["Year"].max()), 1, 1))
+
+def _range_buttons(df) -> list:
+    """Return range selector buttons for the first year and each decade after"""
+    first_year, last_year = int(df["Year"].min()), int(df["Year"].max())
+    starts = [first_year] + list(range(first_year//10*10 + 10, last_year, 10))
+    return [
+        dict(count=last_year - start, label=str(start), step="year", stepmode="backward")
+        for start in starts
+    ]
+
+def _per_capita_bounds(per_cap_df):
+    min_x, max_x = _year_bounds(per_cap_df)
+    min_y = per_cap_df["Million BTU"].min()
+    min_y = min_y - min_y*.05
+
+    max_y = per_cap_df["Million BTU"].max()
+    max_y = max_y + max_y*.05
+
+    return min_x, max_x, min_y, max_y
+
+def _us_total_px(total_df, resource_df, per_cap_df, depiction_type, x_axis_type):
+    import plotly.express as px
+
+    # Determine the marker size
+    marker_size = _marker_size(per_cap_df)
 
-    total_df = consumption_df.groupby(["Year"], as_index=False).sum()
     min_x, max_x, min_y, max_y = calculate_bounds(total_df)
     if depiction_type == "Energy consumption":
         fig = px.scatter(
@@ -52,16 +149,10 @@ def us_total(total_df, primary_df, depiction_type, x_axis_type):
             range_x=[min_x, max_x],
             range_y=[min_y, max_y],
             # height=500,
-            size_max=12
+            size_max=SIZE_MAX
         )
     elif depiction_type == "Energy consumption (per capita)":
-        min_x = datetime.date(1960, 1, 1)
-        min_y = per_cap_df["Million BTU"].min()
-        min_y = min_y - min_y*.05
-
-        max_x = datetime.date(2018, 1, 1)
-        max_y = per_cap_df["Million BTU"].max()
-        max_y = max_y + max_y*.05
+        min_x, max_x, min_y, max_y = _per_capita_bounds(per_cap_df)
 
         fig = px.scatter(
             per_cap_df,
@@ -73,13 +164,12 @@ def us_total(total_df, primary_df, depiction_type, x_axis_type):
             color_continuous_scale=px.colors.diverging.RdYlGn[::-1],
             range_x=[min_x, max_x],
             range_y=[min_y, max_y],
-            size_max=12
+            size_max=SIZE_MAX
         )
     elif depiction_type == "Energy consumption (per resource)":
-        total_resource_df = consumption_df.groupby(["Year", "Source"], as_index=False).sum()
         min_y = 0
         fig = px.area(
-            total_resource_df,
+            resource_df,
             x="Year",
             y="Quadrillion BTU",
             color="Source",
@@ -88,8 +178,6 @@ def us_total(total_df, primary_df, depiction_type, x_axis_type):
             range_y=[min_y, max_y]
         )
     else:
-        resource_df = consumption_df.groupby(
-            ["Year", "Source"], as_index=False).sum()
         min_x, max_x, min_y, max_y = calculate_bounds(resource_df)
         fig = px.line(
             resource_df,
@@ -104,32 +192,7 @@ def us_total(total_df, primary_df, depiction_type, x_axis_type):
     fig.update_layout(
         xaxis=dict(
             rangeselector=dict(
-                buttons=list([
-                    dict(count=58,
-                        label="1960",
-                        step="year",
-                        stepmode="backward"),
-                    dict(count=48,
-                        label="1970",
-                        step="year",
-                        stepmode="backward"),
-                    dict(count=38,
-                        label="1980",
-                        step="year",
-                        stepmode="backward"),
-                    dict(count=28,
-                        label="1990",
-                        step="year",
-                        stepmode="backward"),
-                    dict(count=18,
-                        label="2000",
-                        step="year",
-                        stepmode="backward"),
-                    dict(count=8,
-                        label="2010",
-                        step="year",
-                        stepmode="backward"),
-                ])
+                buttons=_range_buttons(total_df)
             ),
             type="date"
         )
@@ -149,51 +212,139 @@ def us_total(total_df, primary_df, depiction_type, x_axis_type):
     return fig
 
 def calculate_bounds(consumption_df):
-    min_x = datetime.date(1960, 1, 1)
+    min_x, max_x = _year_bounds(consumption_df)
     min_y = consumption_df["Quadrillion BTU"].min()
     min_y = min_y - min_y*.05
 
-    max_x = datetime.date(2018, 1, 1)
     max_y = consumption_df["Quadrillion BTU"].max()
     max_y = max_y + max_y*.05
 
     return min_x, max_x, min_y, max_y
 
+@functools.lru_cache(maxsize=None)
+def _presidential_axes() -> dict:
+    """Return the layout of the presidential overlay, built once"""
+    # 1960 precedes the first term listed in presidents
+    terms = [("1960-01-01", "1961-01-01", "Republican")] + [
+        (president.start, president.end, president.party)
+        for president in presidents.presidents
+    ]
+    shapes = [
+        dict(
+            type="rect", xref="x", yref="y domain",
+            x0=start, x1=end, y0=0, y1=1,
+            fillcolor=plotting.PRESIDENTIAL_PARTY_COLORS[party],
+            opacity=0.5,
+            layer="below",
+            line=dict(width=0.5)
+        )
+        for start, end, party in terms
+    ]
+    return dict(
+        shapes=shapes,
+        xaxis=dict(
+            showgrid=False,
+            ticktext=[president.name for president in presidents.presidents],
+            tickvals=[president.start for president in presidents.presidents],
+            title="President"
+        ),
+        yaxis=dict(showgrid=False)
+    )
+
 def add_presidential_axes(fig) -> None:
-    fig.add_vrect(
-        x0="1960-01-01", x1="1961-01-01",
-        fillcolor=plotting.PRESIDENTIAL_PARTY_COLORS["Republican"], opacity=0.5,
-        layer="below", line_width=.5,
+    fig.update_layout(_presidential_axes())
+
+def _source_traces(template, df, x, y, by="Source"):
+    """Return one trace per source of df, or None if a source has no template"""
+    traces = []
+    for source, source_df in df.groupby(by, sort=False, observed=True):
+        if source not in template:
+            return None
+        traces.append(template.trace(
+            source, x=source_df[x].to_numpy(), y=source_df[y].to_numpy()))
+    return traces
+
+def _sectors_figure(total_df, history, x_axis_type):
+    min_x, max_x = _year_bounds(total_df)
+    max_y = history.sectors_max + history.sectors_max*.05
+    template = ft.template(_sectors_sample, x_axis_type)
+    traces = _source_traces(template, history.sectors, "Year", "Quadrillion BTU", by="Sector")
+    if traces is None:
+        return sectors_area_px(history.sectors, total_df, max_y, x_axis_type)
+    return template.figure(
+        traces,
+        xaxis={"range": [min_x, max_x], "rangeselector": {"buttons": _range_buttons(total_df)}},
+        yaxis={"range": [0, max_y]}
     )
 
-    ticktext = []
-    tickvals = []
-    for president in presidents.presidents:
-        fig.add_vrect(
-            x0=president.start,
-            x1=president.end,
-            fillcolor=plotting.PRESIDENTIAL_PARTY_COLORS[president.party],
-            opacity=0.5,
-            layer="below",
-            line_width=0.5
+def _sectors_sample(x_axis_type):
+    sectors = pd.DataFrame({"Year": 1960, "Sector": sorted(plotting.SECTOR_COLORS),
+                            "Quadrillion BTU": 1.0})
+    return sectors_area_px(sectors, sectors, 1, x_axis_type)
+
+def sectors_area_px(sectors_df, total_df, max_y, x_axis_type):
+    """Return consumption stacked by end-use sector, like us_total's sources"""
+    import plotly.express as px
+
+    min_x, max_x = _year_bounds(total_df)
+    fig = px.area(
+        sectors_df,
+        x="Year",
+        y="Quadrillion BTU",
+        color="Sector",
+        color_discrete_map=plotting.SECTOR_COLORS,
+        range_x=[min_x, max_x],
+        range_y=[0, max_y]
+    )
+    fig.update_layout(
+        xaxis=dict(
+            rangeselector=dict(
+                buttons=_range_buttons(total_df)
+            ),
+            type="date"
         )
-        ticktext.append(president.name)
-        tickvals.append(president.start)
-    fig.update_xaxes(showgrid=False, ticktext=ticktext, tickvals=tickvals, title="President")
-    fig.update_yaxes(showgrid=False)
+    )
+    fig.update_xaxes(showspikes=True)
+    fig.update_yaxes(showspikes=True)
+    fig.update_layout(hovermode="x")
+    if x_axis_type == "President":
+        add_presidential_axes(fig)
+
+    fig.update_layout(plotting.PLOT_COLORS)
+    return fig
+
+def _sources_sample() -> pd.DataFrame:
+    sources = sorted(plotting.ENERGY_SOURCE_COLORS)
+    return pd.DataFrame({"Source": sources, "Quadrillion BTU": 1.0})
 
+@metrics.instrument("figure")
 def us_primary_per_year(primary_df, year):
-    consumption_df = dp.data_subset(primary_df, states=["United States"], sectors=["Total"])
-    consumption_df = consumption_df.groupby(["Year", "Sector", "Source"], as_index=False).sum()
-    consumption_df["BTU"] = consumption_df["BTU"]/1_000_000
-    consumption_df = consumption_df.rename(columns={"BTU": "Quadrillion BTU"})
+    consumption = ro.consumption_rollup(primary_df)
 
-    min_y = 0
-    max_y = consumption_df["Quadrillion BTU"].max()
+    max_y = consumption.us_sources_max
     max_y = max_y + max_y*.05
 
+    year_df = consumption.us_sources_for(year)
+    template = ft.template(_source_bar_sample)
+    traces = _source_traces(template, year_df, "Source", "Quadrillion BTU")
+    if traces is None:
+        return source_bar_plot_px(year_df, max_y)
+    return template.figure(
+        traces,
+        xaxis={"categoryarray": [trace["name"] for trace in traces]},
+        yaxis={"range": [0, max_y]}
+    )
+
+def _source_bar_sample():
+    return source_bar_plot_px(_sources_sample(), 1)
+
+def source_bar_plot_px(year_df, max_y):
+    import plotly.express as px
+
+    min_y = 0
+
     fig = px.bar(
-            consumption_df[consumption_df["Year"] == year],
+            year_df,
             x="Source",
             y="Quadrillion BTU",
             color="Source",
@@ -204,42 +355,36 @@ def us_primary_per_year(primary_df, year):
     fig.update_xaxes(title_text="", categoryorder="total ascending")
     return fig
 
+@metrics.instrument("figure")
 def precompute_state_per_year(total_df, primary_df, depiction, year):
-
-    # Prepare the datasets
-    # primary_df = dp.load_primary_energy_sources(total_df)
-    primary_df = dp.data_subset(primary_df, states=[state for state in total_df["State"].unique(
-    ) if state != "United States"], sectors=["Total"])
-    primary_df["BTU"] = primary_df["BTU"]/1_000_000
-    primary_df = primary_df.rename(columns={"BTU": "Quadrillion BTU"})
-
-    per_cap_df = dp.data_subset(total_df, states=[state for state in total_df["State"].unique(
-    ) if state != "United States"], sources=["Total"], sectors=["Total consumption per capita"])
-    per_cap_df = per_cap_df.rename(columns={"BTU": "Million BTU"})
-
-    max_y = primary_df.groupby(["State", "Year"]).sum()["Quadrillion BTU"].max()
-    per_cap_max_y = per_cap_df.groupby(["State", "Year"]).sum()["Million BTU"].max()
-    max_y = max_y + max_y*.05
-
-    # Create all possible combinations of plots
-    # depiction_types = ["Energy consumption", "Energy consumption (per capita)"]
-    # years = total_df["Year"].unique()
-    # combinations = [[depiction, year]
-    #                 for depiction in depiction_types for year in years]
-
-    # figs = {}
-    # for depiction, year in combinations:
+    # Everything but the year slice is computed once per dataset
     if depiction == "Energy consumption":
-        year_df = primary_df[primary_df["Year"] == year]
-        year_df = year_df.groupby("State", as_index=False).sum()
-        fig = state_bar_plot(year_df, max_y)
+        index = ro.consumption_rollup(primary_df).state_totals
+        max_y = index.max_value
+        max_y = max_y + max_y*.05
+        fig = state_bar_plot(index.for_year(year), max_y)
     else:
-        year_df = per_cap_df[per_cap_df["Year"] == year]
-        fig = state_per_cap_bar_plot(year_df, per_cap_max_y)
-        # figs[depiction+str(year)] = fig
+        index = ro.per_capita_rollup(total_df).state_per_capita
+        fig = state_per_cap_bar_plot(index.for_year(year), index.max_value)
     return fig
 
+@metrics.instrument("figure")
 def state_bar_plot(primary_df, max_y):
+    template = ft.template(_state_bar_sample)
+    return template.figure(
+        [template.trace(
+            x=primary_df["State"].to_numpy(),
+            y=primary_df["Quadrillion BTU"].to_numpy()
+        )],
+        yaxis={"range": [0, max_y]}
+    )
+
+def _state_bar_sample():
+    return state_bar_plot_px(pd.DataFrame({"State": ["Alabama"], "Quadrillion BTU": [1.0]}), 1)
+
+def state_bar_plot_px(primary_df, max_y):
+    import plotly.express as px
+
     # Prepare the dataset
 
     min_y = 0
@@ -256,7 +401,26 @@ def state_bar_plot(primary_df, max_y):
     fig.update_layout(plotting.PLOT_COLORS, showlegend=False)
     return fig
 
+@metrics.instrument("figure")
 def state_per_cap_bar_plot(per_cap_df, max_y):
+    template = ft.template(_state_per_cap_bar_sample)
+    per_capita = per_cap_df["Million BTU"].to_numpy()
+    return template.figure(
+        [template.trace(
+            x=per_cap_df["State"].to_numpy(),
+            y=per_capita,
+            marker={"color": per_capita}
+        )],
+        yaxis={"range": [0, max_y]},
+        coloraxis={"cmin": 0, "cmax": max_y}
+    )
+
+def _state_per_cap_bar_sample():
+    return state_per_cap_bar_plot_px(pd.DataFrame({"State": ["Alabama"], "Million BTU": [1.0]}), 1)
+
+def state_per_cap_bar_plot_px(per_cap_df, max_y):
+    import plotly.express as px
+
     min_y = 0
 
     fig = px.bar(
@@ -273,14 +437,29 @@ def state_per_cap_bar_plot(per_cap_df, max_y):
     fig.update_layout(plotting.PLOT_COLORS, showlegend=False)
     return fig
 
+@metrics.instrument("figure")
 def pie_plot_per_year(primary_df, year):
-    consumption_df = dp.data_subset(primary_df, states=["United States"], sectors=["Total"])
-    consumption_df = consumption_df.groupby(["Year", "Sector", "Source"], as_index=False).sum()
-    consumption_df["BTU"] = consumption_df["BTU"]/1_000_000
-    consumption_df = consumption_df.rename(columns={"BTU": "Quadrillion BTU"})
+    year_df = ro.consumption_rollup(primary_df).us_sources_for(year)
+
+    sources = year_df["Source"].tolist()
+    if not set(sources) <= set(plotting.ENERGY_SOURCE_COLORS):
+        return source_pie_plot_px(year_df)
+    template = ft.template(_source_pie_sample)
+    return template.figure([template.trace(
+        labels=sources,
+        values=year_df["Quadrillion BTU"].to_numpy(),
+        customdata=[[source] for source in sources],
+        marker={"colors": [plotting.ENERGY_SOURCE_COLORS[source] for source in sources]}
+    )])
+
+def _source_pie_sample():
+    return source_pie_plot_px(_sources_sample())
+
+def source_pie_plot_px(year_df):
+    import plotly.express as px
 
     fig = px.pie(
-            consumption_df[consumption_df["Year"] == year],
+            year_df,
             names="Source",
             values="Quadrillion BTU",
             color="Source",
@@ -290,21 +469,42 @@ def pie_plot_per_year(primary_df, year):
     fig.update_layout(plotting.PLOT_COLORS)
     return fig
 
+def build_templates() -> None:
+    """Build the template of every figure type ahead of the first request"""
+    for x_axis in X_AXIS_TYPES:
+        for depiction in MAIN_DEPICTIONS:
+            ft.template(_us_total_sample, depiction, x_axis)
+        ft.template(_sectors_sample, x_axis)
+    for sample in [_source_bar_sample, _state_bar_sample,
+                   _state_per_cap_bar_sample, _source_pie_sample]:
+        ft.template(sample)
+
+@metrics.instrument("figure")
 def update_choropleth(df, geojson):
-    # Prepare the datasets
-    primary_df = dp.load_primary_energy_sources(df)
-    primary_df = dp.data_subset(primary_df, states=[state for state in primary_df["State"].unique(
-    ) if state != "United States"], sectors=["Total"])
-    primary_df["BTU"] = primary_df["BTU"]/1_000_000
-    primary_df = primary_df.rename(columns={"BTU": "Quadrillion BTU"})
-    primary_df = primary_df.groupby(["State", "Year"], as_index=False).sum()
-    primary_df = primary_df[primary_df["Year"] == 2018]
-
-    per_cap_df = dp.data_subset(df, states=[state for state in df["State"].unique(
-    ) if state != "United States"], sources=["Total"], sectors=["Total consumption per capita"])
-    per_cap_df = per_cap_df.rename(columns={"BTU": "Million BTU per capita"})
-
-    max_y = per_cap_df["Million BTU per capita"].max()
+    """Return a choropleth animated over every year"""
+    index = ro.per_capita_rollup(df).state_per_capita
+    return _choropleth(index.frame, geojson, index.max_value, animation_frame="Year")
+
+@metrics.instrument("figure")
+def choropleth_per_year(df, geojson, year):
+    """Return a choropleth of a single year"""
+    index = ro.per_capita_rollup(df).state_per_capita
+    return _choropleth(index.for_year(year), geojson, index.max_value)
+
+@metrics.instrument("prep")
+def choropleth_values(df, year) -> dict:
+    """Return what changes in choropleth_per_year from one year to another"""
+    year_df = ro.per_capita_rollup(df).state_per_capita.for_year(year)
+    return {
+        "locations": year_df["State"].tolist(),
+        "z": year_df["Million BTU"].tolist()
+    }
+
+def _choropleth(per_cap_df, geojson, max_y, **kwargs):
+    import plotly.express as px
+
+    per_cap_df = per_cap_df.rename(
+        columns={"Million BTU": "Million BTU per capita"})
 
     fig = px.choropleth_mapbox(
                             per_cap_df,
@@ -314,13 +514,12 @@ def update_choropleth(df, geojson):
                             featureidkey="properties.NAME",
                             color_continuous_scale=plotly.colors.diverging.Temps,
                             range_color=(0, max_y),
-                            animation_frame="Year",
+                            **kwargs
     )
     fig.update_layout(
                 mapbox_style="carto-positron",
-                mapbox_zoom=2.2,
+                mapbox_zoom=plotting.MAPBOX_ZOOM,
                 mapbox_center={"lat": 37.8, "lon": -95.7},
     )
     fig.update_layout(plotting.CHOROPLETH_COLORS)
-    # fig.update_layout(plotting.CHOROPLETH_COLORS)
     return fig
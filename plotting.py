@@ -8,6 +8,12 @@ ENERGY_SOURCE_COLORS = {
     "Natural gas": '#EE7674',
     "Renewables": '#9DBF9E',
 }
+SECTOR_COLORS = {
+    "Residential": '#F4A259',
+    "Commercial": '#7A89C2',
+    "Industrial": '#525B76',
+    "Transportation": '#EE7674',
+}
 PLOT_COLORS = {
     'plot_bgcolor': '#fffffa',
     'paper_bgcolor': '#fffffa'
@@ -25,5 +31,7 @@ PRESIDENTIAL_PARTY_COLORS = {
 
 PLOT_HEIGHT="90%"
 
+MAPBOX_ZOOM = 2.2
+
 places = ["United Kingdom", "Scotland", "Wales", "Northern Ireland", "East Midlands", "East Of England", "London", "North East", "North West", "South East", "South West", "West Midlands", "Yorkshire And The Humber"]
 REGION_COLORS = dict(zip(places, plotly.colors.qualitative.Prism))
@@ -0,0 +1,56 @@
+# Purpose: render every reachable dashboard figure into the figure store
+# Usage: python prerender.py [--out data/prerendered]
+
+import argparse
+import time
+
+import dataset_versions as dv
+import figure_store as fs
+import plot_computations as pc
+import rollups as ro
+import serialization
+
+def reachable_figures(df, primary_df):
+    """Yield (build, args) for every figure the dashboard can request"""
+    for depiction in pc.MAIN_DEPICTIONS:
+        for x_axis in pc.X_AXIS_TYPES:
+            yield pc.precompute_main_plots, (df, primary_df, depiction, x_axis)
+
+    for state in ro.consumption_rollup(primary_df).state_totals.states:
+        for depiction in pc.HISTORY_DEPICTIONS:
+            for x_axis in pc.X_AXIS_TYPES:
+                yield pc.state_history, (df, primary_df, state, depiction, x_axis)
+
+    for year in sorted(int(year) for year in df["Year"].unique()):
+        yield pc.us_primary_per_year, (primary_df, year)
+        yield pc.pie_plot_per_year, (primary_df, year)
+        for depiction in pc.STATE_DEPICTIONS:
+            yield pc.precompute_state_per_year, (df, primary_df, depiction, year)
+
+def render_figures(df, primary_df):
+    """Yield (store key, figure JSON) for every reachable figure"""
+    for build, args in reachable_figures(df, primary_df):
+        yield fs.figure_key(build, *args), serialization.figure_to_json(build(*args))
+
+def prerender(out=fs.STORE_DIR) -> int:
+    """Write the figures of the current dataset to the store at out
+
+    The store is keyed by the dataset version the app loads, so the app
+    opens it until the SEDS file changes. Returns the number of figures.
+    """
+    dataset = dv.load()
+    ro.build_rollups(dataset.df, dataset.primary_df)
+    return fs.write_store(render_figures(dataset.df, dataset.primary_df), dataset.key, out)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Render every reachable dashboard figure ahead of time")
+    parser.add_argument("--out", default=fs.STORE_DIR, help="store directory")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = prerender(args.out)
+    print(f"Rendered {count} figures to {args.out} in {time.perf_counter() - start:.1f}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,7 @@
 from dataclasses import dataclass 
 
+import numpy as np
+
 @dataclass
 class President:
     name: str 
@@ -75,3 +77,16 @@ presidents = [
         party="Republican"
     ),
 ]
+
+# Terms start and end on January 1st, so a year belongs to the president in
+# office on its first day
+TERM_STARTS = np.array([int(president.start[:4]) for president in presidents])
+TERM_ENDS = np.array([int(president.end[:4]) for president in presidents])
+
+def term_index(years) -> np.ndarray:
+    """Return the position in presidents of the term each of years falls in,
+    or -1 for years outside every term"""
+    years = np.asarray(years)
+    terms = np.searchsorted(TERM_STARTS, years, side="right") - 1
+    in_term = (terms >= 0) & (years < TERM_ENDS[terms.clip(0)])
+    return np.where(in_term, terms, -1)
@@ -0,0 +1,172 @@
+# Purpose: compressed, ETag-cached responses for the Dash callbacks
+#
+# Callbacks are pure functions of their request and the dataset, so the
+# response to a callback request is cached as bytes, keyed by a hash of the
+# request body and the dataset version. A repeat request is answered from
+# that buffer without running Dash at all, or with 304 Not Modified when the
+# client sends back the ETag it already has. JSON responses are compressed
+# with brotli when installed and the client accepts it, else with gzip.
+
+from collections import OrderedDict
+import gzip
+import hashlib
+import os
+import threading
+
+import flask
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CALLBACK_PATH = "_dash-update-component"
+# Responses smaller than this are sent as they are
+MIN_COMPRESS_SIZE = 1_000
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+def _accepted_encoding(size) -> str:
+    """Return the encoding to send a body of size bytes in"""
+    accept_encoding = flask.request.headers.get("Accept-Encoding", "")
+    if size < MIN_COMPRESS_SIZE:
+        return "identity"
+    if brotli is not None and "br" in accept_encoding:
+        return "br"
+    if "gzip" in accept_encoding:
+        return "gzip"
+    return "identity"
+
+def compress(body, encoding) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=GZIP_LEVEL)
+    return body
+
+class CachedResponse:
+    """Body of a callback response, with its compressed forms made on demand"""
+
+    def __init__(self, body, mimetype="application/json"):
+        self.etag = hashlib.sha1(body).hexdigest()[:20]
+        self.mimetype = mimetype
+        self._bodies = {"identity": body}
+
+    def __len__(self) -> int:
+        return len(self._bodies["identity"])
+
+    def body(self, encoding) -> bytes:
+        compressed = self._bodies.get(encoding)
+        if compressed is None:
+            compressed = self._bodies[encoding] = compress(self._bodies["identity"], encoding)
+        return compressed
+
+class ResponseCache:
+    """Bounded LRU mapping of request hashes to CachedResponses"""
+
+    def __init__(self, maxsize=512):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self._responses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            cached = self._responses.get(key)
+            if cached is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._responses.move_to_end(key)
+            return cached
+
+    def put(self, key, body, mimetype="application/json") -> CachedResponse:
+        cached = CachedResponse(body, mimetype)
+        with self._lock:
+            self._responses[key] = cached
+            while len(self._responses) > self.maxsize:
+                self._responses.popitem(last=False)
+        return cached
+
+    def response(self, cached) -> flask.Response:
+        """Return cached as the response to the current request
+
+        A client that already has its ETag gets 304 Not Modified, any other
+        the body in the encoding it accepts.
+        """
+        if cached.etag in flask.request.if_none_match:
+            self.not_modified += 1
+            response = flask.Response(status=304)
+            response.set_etag(cached.etag)
+            return response
+        encoding = _accepted_encoding(len(cached))
+        flask.g.response_cached = True
+        return _encoded(flask.Response(mimetype=cached.mimetype), cached.body(encoding),
+                        encoding, cached.etag)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._responses.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._responses),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "not_modified": self.not_modified,
+            }
+
+RESPONSE_CACHE = ResponseCache(maxsize=int(os.environ.get("RESPONSE_CACHE_SIZE", 512)))
+
+def _encoded(response, body, encoding, etag=None):
+    response.set_data(body)
+    if encoding != "identity":
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    if etag is not None:
+        response.set_etag(etag)
+    return response
+
+def init_app(app, version=lambda: "", cache=RESPONSE_CACHE) -> None:
+    """Compress the JSON responses of the Dash app and cache its callbacks
+
+    version returns a string identifying the dataset the callbacks read, so
+    responses cached for an older dataset are never served.
+    """
+    server = app.server
+
+    @server.before_request
+    def _serve_cached():
+        if not flask.request.path.endswith(CALLBACK_PATH):
+            return None
+        key = hashlib.sha1(version().encode() + flask.request.get_data()).digest()
+        flask.g.response_key = key
+        cached = cache.get(key)
+        if cached is None:
+            return None
+        return cache.response(cached)
+
+    @server.after_request
+    def _compress(response):
+        if flask.g.pop("response_cached", False):
+            return response
+        if response.status_code != 200 or response.direct_passthrough \
+                or response.mimetype != "application/json" \
+                or "Content-Encoding" in response.headers:
+            return response
+        body = response.get_data()
+        encoding = _accepted_encoding(len(body))
+
+        key = flask.g.pop("response_key", None)
+        if key is not None:
+            cached = cache.put(key, body)
+            return _encoded(response, cached.body(encoding), encoding, cached.etag)
+        return _encoded(response, compress(body, encoding), encoding)
+
+    @server.route("/response-cache")
+    def response_cache_stats():
+        return flask.jsonify(cache.stats())
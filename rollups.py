@@ -0,0 +1,249 @@
+# Purpose: aggregates of the dataset shared by every plot
+
+from dataclasses import dataclass
+import weakref
+
+import pandas as pd
+
+import data_processing as dp
+import metrics
+import presidents
+
+# The dataset is in billion BTU
+BTU_PER_QUADRILLION = 1_000_000
+
+END_USE_SECTORS = ["Commercial", "Industrial", "Residential", "Transportation"]
+
+@dataclass
+class StateYearIndex:
+    """Per-state values of one measure, split by year and by state"""
+    frame: pd.DataFrame
+    states: list
+    max_value: float
+    by_year: dict
+    by_state: dict
+
+    def for_year(self, year) -> pd.DataFrame:
+        return self.by_year.get(year, self.frame.iloc[:0])
+
+    def for_state(self, state) -> pd.DataFrame:
+        return self.by_state.get(state, self.frame.iloc[:0])
+
+@dataclass
+class ConsumptionRollup:
+    """Primary energy source consumption in quadrillion BTU"""
+    us_sources: pd.DataFrame
+    us_sources_by_year: dict
+    us_totals: pd.DataFrame
+    us_sources_max: float
+    state_totals: StateYearIndex
+    administrations: pd.DataFrame
+
+    def us_sources_for(self, year) -> pd.DataFrame:
+        return self.us_sources_by_year.get(year, self.us_sources.iloc[:0])
+
+@dataclass
+class PerCapitaRollup:
+    """Total consumption per capita in million BTU"""
+    us_per_capita: pd.DataFrame
+    state_per_capita: StateYearIndex
+
+@dataclass
+class StateHistory:
+    """Yearly primary energy consumption of one state in quadrillion BTU"""
+    sources: pd.DataFrame
+    sectors: pd.DataFrame
+    # Largest yearly sum of the end-use sectors
+    sectors_max: float
+
+@dataclass
+class StateHistoryRollup:
+    """The history of every state by source and by end-use sector"""
+    by_state: dict
+
+    def __contains__(self, state) -> bool:
+        return state in self.by_state
+
+    def for_state(self, state) -> StateHistory:
+        return self.by_state[state]
+
+def _group_sum(df, by, value) -> pd.DataFrame:
+    df = df.groupby(by, as_index=False, observed=True)[value].sum()
+    return df.sort_values(by, ignore_index=True)
+
+def _split_by_year(df) -> dict:
+    return {int(year): year_df for year, year_df in df.groupby("Year", sort=False)}
+
+def _split_by_state(df) -> dict:
+    return {state: state_df for state, state_df in df.groupby("State", sort=False, observed=True)}
+
+def _in_quadrillion(df) -> pd.DataFrame:
+    df["BTU"] = df["BTU"]/BTU_PER_QUADRILLION
+    return df.rename(columns={"BTU": "Quadrillion BTU"})
+
+def _states(df) -> list:
+    states = df["State"].unique()
+    return list(states[states != "United States"])
+
+def _state_year_index(df, value) -> StateYearIndex:
+    return StateYearIndex(
+        frame=df,
+        states=sorted(df["State"].unique()),
+        max_value=_group_sum(df, ["State", "Year"], value)[value].max(),
+        by_year=_split_by_year(df),
+        by_state=_split_by_state(df)
+    )
+
+def _administrations(us_sources, us_totals) -> pd.DataFrame:
+    """Return consumption aggregated over each presidential term
+
+    Average is the mean yearly total, Growth the compound yearly change from
+    the first to the last year of the term and the remaining columns the
+    share of each source over the term. Years outside every term are left
+    out.
+    """
+    terms = presidents.term_index(us_totals["Year"].to_numpy())
+    totals = us_totals.assign(Term=terms)[terms >= 0]
+    by_term = totals.groupby("Term")["Quadrillion BTU"]
+    years = by_term.size()
+    administrations = pd.DataFrame({
+        "Years": years,
+        "Average": by_term.mean(),
+        "Growth": ((by_term.last()/by_term.first())**(1/(years - 1)) - 1).where(years > 1),
+    })
+
+    source_terms = presidents.term_index(us_sources["Year"].to_numpy())
+    sources = us_sources.assign(Term=source_terms)[source_terms >= 0]
+    mix = sources.pivot_table(index="Term", columns="Source", values="Quadrillion BTU",
+                              aggfunc="sum", observed=True)
+    mix = mix.div(mix.sum(axis=1), axis=0)
+    mix.columns = list(mix.columns)
+
+    terms = [presidents.presidents[term] for term in administrations.index]
+    administrations.insert(0, "President", [president.name for president in terms])
+    administrations.insert(1, "Party", [president.party for president in terms])
+    administrations.insert(2, "Start", [int(president.start[:4]) for president in terms])
+    return administrations.join(mix).reset_index(drop=True)
+
+def _consumption_frames(primary_df):
+    """Return the yearly US source totals and state totals of primary_df"""
+    us_df = dp.data_subset(primary_df, states=["United States"], sectors=["Total"])
+    us_sources = _in_quadrillion(_group_sum(us_df, ["Year", "Source"], "BTU"))
+
+    state_df = dp.data_subset(primary_df, states=_states(primary_df), sectors=["Total"])
+    state_totals = _in_quadrillion(_group_sum(state_df, ["State", "Year"], "BTU"))
+    return us_sources, state_totals
+
+def _consumption_rollup(us_sources, state_totals) -> ConsumptionRollup:
+    us_totals = _group_sum(us_sources, ["Year"], "Quadrillion BTU")
+    return ConsumptionRollup(
+        us_sources=us_sources,
+        us_sources_by_year=_split_by_year(us_sources),
+        us_totals=us_totals,
+        us_sources_max=us_sources["Quadrillion BTU"].max(),
+        state_totals=_state_year_index(state_totals, "Quadrillion BTU"),
+        administrations=_administrations(us_sources, us_totals)
+    )
+
+def build_consumption_rollup(primary_df) -> ConsumptionRollup:
+    return _consumption_rollup(*_consumption_frames(primary_df))
+
+def build_per_capita_rollup(total_df) -> PerCapitaRollup:
+    us_per_capita = dp.data_subset(
+        total_df, states=["United States"],
+        sectors=["Total consumption per capita"], sources=["Total"]
+    )
+    us_per_capita = us_per_capita.rename(columns={"BTU": "Million BTU"})
+
+    state_per_capita = dp.data_subset(
+        total_df, states=_states(total_df),
+        sectors=["Total consumption per capita"], sources=["Total"]
+    )
+    state_per_capita = state_per_capita.rename(columns={"BTU": "Million BTU"})
+
+    return PerCapitaRollup(
+        us_per_capita=us_per_capita,
+        state_per_capita=_state_year_index(state_per_capita, "Million BTU")
+    )
+
+def build_state_history_rollup(primary_df) -> StateHistoryRollup:
+    states = _states(primary_df)
+    sources = _in_quadrillion(_group_sum(
+        dp.data_subset(primary_df, states=states, sectors=["Total"]),
+        ["State", "Year", "Source"], "BTU"))
+    sectors = _in_quadrillion(_group_sum(
+        dp.data_subset(primary_df, states=states, sectors=END_USE_SECTORS),
+        ["State", "Year", "Sector"], "BTU"))
+    sectors_max = _group_sum(sectors, ["State", "Year"], "Quadrillion BTU") \
+        .groupby("State", observed=True)["Quadrillion BTU"].max()
+
+    # Split once here so that showing a state is a lookup, not a scan
+    sources_by_state = _split_by_state(sources)
+    sectors_by_state = _split_by_state(sectors)
+    return StateHistoryRollup({
+        state: StateHistory(
+            sources=sources_by_state.get(state, sources.iloc[:0]),
+            sectors=sectors_by_state.get(state, sectors.iloc[:0]),
+            sectors_max=sectors_max.get(state, 0.0)
+        )
+        for state in states
+    })
+
+_ROLLUPS = {}
+
+def _rollup(df, build):
+    """Return build(df), computing it once for as long as df is alive"""
+    rollup = _ROLLUPS.get((build.__name__, id(df)))
+    if rollup is None:
+        rollup = _store(df, build, build(df))
+    return rollup
+
+def _store(df, build, rollup):
+    """Keep rollup as build(df) for as long as df is alive"""
+    key = (build.__name__, id(df))
+    _ROLLUPS[key] = rollup
+    weakref.finalize(df, _ROLLUPS.pop, key, None)
+    return rollup
+
+@metrics.instrument("prep")
+def consumption_rollup(primary_df) -> ConsumptionRollup:
+    return _rollup(primary_df, build_consumption_rollup)
+
+@metrics.instrument("prep")
+def per_capita_rollup(total_df) -> PerCapitaRollup:
+    return _rollup(total_df, build_per_capita_rollup)
+
+@metrics.instrument("prep")
+def state_history_rollup(primary_df) -> StateHistoryRollup:
+    return _rollup(primary_df, build_state_history_rollup)
+
+def _spliced(old_frame, new_frame, years, by) -> pd.DataFrame:
+    """Return the rows of old_frame outside years with new_frame's added"""
+    kept = old_frame[~old_frame["Year"].isin(years)]
+    return dp.concat_datasets([kept, new_frame]).sort_values(by, ignore_index=True)
+
+def refresh_rollups(old_primary, total_df, primary_df, years) -> None:
+    """Materialize the rollups of a refreshed dataset
+
+    Only years are aggregated again, the consumption of the other years is
+    taken from the rollup of old_primary. The per capita rollup is a
+    selection of rows rather than an aggregate and is simply rebuilt, as is
+    the state history, a split of small aggregates.
+    """
+    old = consumption_rollup(old_primary)
+    dataset_years = set(int(year) for year in primary_df["Year"].unique())
+    # Years dropped from the dataset go along with the changed ones
+    stale = set(years) | (set(old.us_totals["Year"].astype(int)) - dataset_years)
+    us_sources, state_totals = _consumption_frames(dp.data_subset(primary_df, years=list(years)))
+    _store(primary_df, build_consumption_rollup, _consumption_rollup(
+        _spliced(old.us_sources, us_sources, stale, ["Year", "Source"]),
+        _spliced(old.state_totals.frame, state_totals, stale, ["State", "Year"])
+    ))
+    per_capita_rollup(total_df)
+    state_history_rollup(primary_df)
+
+def build_rollups(total_df, primary_df) -> None:
+    """Materialize every rollup of the dataset ahead of the first request"""
+    per_capita_rollup(total_df)
+    consumption_rollup(primary_df)
+    state_history_rollup(primary_df)
@@ -0,0 +1,165 @@
+# Purpose: the other SEDS tables, loaded on first use within a memory budget
+#
+# The dashboard's consumption data is the active DatasetVersion. The
+# physical units, price, expenditure and production tables go through the
+# same ingest_rows pipeline and code tables, but only once something asks
+# for them. Loaded tables stay in memory until the registry goes over its
+# budget, counted over each frame and its subset indexes, which evicts the least recently used ones; an evicted table comes
+# back from the on-disk cache. Loads and evictions are counted in stats()
+# and recorded by the metrics histograms.
+
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import data_processing as dp
+import dataset_cache
+import metrics
+
+# End-use sectors, their total and the electric power sector
+SECTOR_CODES = ("AC", "CC", "IC", "RC", "TC", "EI")
+
+@dataclass(frozen=True)
+class SedsTable:
+    """A wide SEDS file in the data directory and the MSNs kept from it"""
+    fname: str
+    description: str
+    unit_codes: tuple
+    sector_codes: tuple = SECTOR_CODES
+
+    @property
+    def path(self) -> str:
+        return os.path.join(dp.DATA_DIR, self.fname)
+
+    def keeps(self, msns) -> np.ndarray:
+        """Return whether each of msns is a series of the table"""
+        # The MSN's own sector code, ET is not remapped to TC here
+        msns = pd.Series(msns, dtype=object)
+        return (msns.str[4:].isin(self.unit_codes)
+                & msns.str[2:4].isin(self.sector_codes)).to_numpy()
+
+TABLES = {
+    "physical": SedsTable("use_all_phy.csv", "Consumption in physical units", ("P",)),
+    "price": SedsTable("pr_all.csv", "Prices", ("D",)),
+    "expenditure": SedsTable("ex_all.csv", "Expenditures", ("V",)),
+    "production": SedsTable("prod_all.csv", "Production", ("B", "P"), ("PR",)),
+}
+
+# Compared and hashed by identity, so a loaded table can key a cache
+@dataclass(frozen=True, eq=False)
+class LoadedTable:
+    name: str
+    key: str
+    df: pd.DataFrame
+    # Of the frame and its subset indexes
+    nbytes: int
+    # Modification time and size of the file it was loaded from
+    stats: tuple
+
+def _file_stats(path) -> tuple:
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+class TableRegistry:
+    """SEDS tables loaded on first use, least recently used evicted over budget
+
+    budget is in bytes. A table larger than the whole budget is still
+    loaded, and evicts every other one.
+    """
+
+    def __init__(self, tables=TABLES, budget=256*2**20, history=100):
+        self.tables = tables
+        self.budget = budget
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.events = deque(maxlen=history)
+        self._loaded = OrderedDict()
+        self._lock = threading.Lock()
+        # One load of a table at a time, other tables load meanwhile
+        self._load_locks = {name: threading.Lock() for name in tables}
+
+    def available(self) -> list:
+        """Return the names of the tables whose file is in the data directory"""
+        return [name for name, table in self.tables.items() if os.path.exists(table.path)]
+
+    def get(self, name) -> LoadedTable:
+        """Return the table name, loading it if it isn't loaded or has changed
+
+        Raises KeyError for an unknown name and FileNotFoundError when its
+        file isn't in the data directory.
+        """
+        table = self.tables[name]
+        with self._load_locks[name]:
+            stats = _file_stats(table.path)
+            with self._lock:
+                loaded = self._loaded.get(name)
+                if loaded is not None and loaded.stats == stats:
+                    self.hits += 1
+                    self._loaded.move_to_end(name)
+                    return loaded
+            loaded = self._load(name, table, stats)
+            with self._lock:
+                self._loaded[name] = loaded
+                self._loaded.move_to_end(name)
+                self._evict()
+            return loaded
+
+    def _load(self, name, table, stats) -> LoadedTable:
+        start = time.perf_counter()
+        key = dataset_cache.input_key(
+            [table.path, dp.STATES_PATH, dp.ENERGY_CODES_PATH,
+             dp.SECTOR_CODES_PATH, dp.UNIT_CODES_PATH], table=name)
+        df = dataset_cache.read_frame(f"table-{name}", key)
+        source = "cache"
+        if df is None:
+            rows = dp.read_rows(table.path, table.keeps, dp.INGEST_CHUNKSIZE)
+            # In the table's units, which are not always BTU
+            df = dp.ingest_rows(rows, categorical=True).rename(columns={"BTU": "Value"})
+            dataset_cache.write_frame(df, f"table-{name}", key)
+            source = "file"
+        # Built now, as every subset request needs them, so the budget counts them
+        index_bytes = sum(array.nbytes for array in dp.subset_index_arrays(df).values())
+        seconds = time.perf_counter() - start
+
+        loaded = LoadedTable(name, key, df, dp.memory_footprint(df) + index_bytes, stats)
+        metrics.TABLE_LOAD_SECONDS.observe(seconds, name, source)
+        with self._lock:
+            self.loads += 1
+            self._record("load", name, loaded.nbytes, source=source, seconds=round(seconds, 4))
+        return loaded
+
+    def _evict(self) -> None:
+        # Called holding the lock, with the table just used last
+        while len(self._loaded) > 1 and self.resident_bytes() > self.budget:
+            name, loaded = self._loaded.popitem(last=False)
+            self.evictions += 1
+            metrics.TABLE_EVICTED_BYTES.observe(loaded.nbytes, name)
+            self._record("evict", name, loaded.nbytes)
+
+    def _record(self, event, name, nbytes, **details) -> None:
+        self.events.append({"time": time.time(), "event": event, "table": name,
+                            "bytes": nbytes, **details})
+
+    def resident_bytes(self) -> int:
+        return sum(loaded.nbytes for loaded in self._loaded.values())
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "budget": self.budget,
+                "resident_bytes": self.resident_bytes(),
+                # Least recently used first
+                "loaded": list(self._loaded),
+                "hits": self.hits,
+                "loads": self.loads,
+                "evictions": self.evictions,
+                "events": list(self.events),
+            }
+
+REGISTRY = TableRegistry(budget=int(float(os.environ.get("SEDS_TABLES_BUDGET_MB", 256))*2**20))
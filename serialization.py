@@ -0,0 +1,79 @@
+# Purpose: compact, fast JSON for figure payloads
+#
+# orjson is used when installed and the standard library otherwise. Floats
+# are rounded to SIGNIFICANT_DIGITS, well beyond what a plot can show, so
+# that they print short instead of with every digit of a double.
+
+import json
+import os
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+SIGNIFICANT_DIGITS = int(os.environ.get("FIGURE_SIGNIFICANT_DIGITS", 7))
+
+def _round_array(values, digits):
+    rounded = values.astype(float)
+    nonzero = np.isfinite(rounded) & (rounded != 0)
+    magnitude = np.floor(np.log10(np.abs(rounded[nonzero])))
+    # Scale by exact powers of ten only, so the rounded numbers are the
+    # nearest doubles to their decimals and print without trailing noise
+    shift = (digits - 1 - magnitude).astype(int)
+    scale = 10.0**np.abs(shift)
+    numbers = rounded[nonzero]
+    rounded[nonzero] = np.where(
+        shift >= 0, np.round(numbers*scale)/scale, np.round(numbers/scale)*scale)
+    return rounded
+
+# Subtrees whose numbers are already short: the plotly theme, and GeoJSON
+# quantized by geography.py
+UNROUNDED_KEYS = {"template", "geojson"}
+
+def compact_floats(obj, digits=SIGNIFICANT_DIGITS):
+    """Return obj with every float rounded to digits significant digits"""
+    if isinstance(obj, dict):
+        return {
+            key: value if key in UNROUNDED_KEYS else compact_floats(value, digits)
+            for key, value in obj.items()
+        }
+    if isinstance(obj, (list, tuple)):
+        return [compact_floats(value, digits) for value in obj]
+    if isinstance(obj, np.ndarray) and obj.dtype.kind == "f":
+        return _round_array(obj, digits)
+    if isinstance(obj, float):
+        return float(f"{obj:.{digits}g}")
+    return obj
+
+def _default(obj):
+    """Encode what orjson cannot the way PlotlyJSONEncoder does"""
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if hasattr(obj, "isoformat"):
+        return obj.isoformat()
+    if hasattr(obj, "to_plotly_json"):
+        return obj.to_plotly_json()
+    raise TypeError(f"Cannot serialize {type(obj).__name__}")
+
+def dumps(obj) -> bytes:
+    """Return obj as compact JSON bytes"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default,
+                            option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    import plotly.io as pio
+    return pio.to_json(obj, validate=False, remove_uids=False).encode()
+
+def figure_to_json(fig, digits=SIGNIFICANT_DIGITS) -> str:
+    """Return the JSON of fig with its floats compacted"""
+    figure = fig.to_plotly_json() if hasattr(fig, "to_plotly_json") else fig
+    return dumps(compact_floats(figure, digits)).decode()
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
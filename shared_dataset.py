@@ -0,0 +1,81 @@
+# Purpose: one copy of the processed datasets shared by every server worker
+
+import os
+import shutil
+
+import numpy as np
+
+import data_processing as dp
+import dataset_cache
+
+SHARED_DIR = os.path.join("data", "shared")
+
+def _frame_dir(path, name) -> str:
+    return os.path.join(path, name)
+
+def _index_dir(path) -> str:
+    return os.path.join(path, "index")
+
+def _save_arrays(arrays, path) -> None:
+    os.makedirs(path)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array, allow_pickle=False)
+
+def _map_arrays(path) -> dict:
+    return {
+        fname[:-4]: np.load(os.path.join(path, fname), mmap_mode="r")
+        for fname in os.listdir(path) if fname.endswith(".npy")
+    }
+
+def export_frame(df, path) -> None:
+    """Write df and its subset indexes to path as one .npy file per array"""
+    arrays = dataset_cache.encode_frame(df)
+    _save_arrays({name: array for name, array in arrays.items() if name != "meta"}, path)
+    with open(os.path.join(path, "meta.json"), "w") as outfile:
+        outfile.write(str(arrays["meta"]))
+    _save_arrays(dp.subset_index_arrays(df), _index_dir(path))
+
+def attach_frame(path):
+    """Return the frame exported to path, backed by read-only memory maps
+
+    Its subset indexes are mapped too, rather than built by every process.
+    """
+    with open(os.path.join(path, "meta.json")) as infile:
+        arrays = {"meta": infile.read(), **_map_arrays(path)}
+    df = dataset_cache.decode_frame(arrays)
+    # Exports written before the indexes were shared build them on first use
+    if os.path.isdir(_index_dir(path)):
+        dp.attach_subset_index(df, _map_arrays(_index_dir(path)))
+    return df
+
+def load_shared(path=SHARED_DIR, on_rows=None):
+    """Return the categorical dataset and primary sources as memory maps
+
+    The first process to find no export for the current inputs writes one.
+    Every process then maps the same files, so the operating system keeps a
+    single copy of the data in its page cache however many workers attach.
+    on_rows is passed on to dp.load_datasets.
+    """
+    key = dp.dataset_key(categorical=True)
+    export_dir = os.path.join(path, key)
+    if not os.path.isdir(export_dir):
+        df, primary_df = dp.load_datasets(categorical=True, on_rows=on_rows)
+        tmp_dir = f"{export_dir}.{os.getpid()}.tmp"
+        export_frame(df, _frame_dir(tmp_dir, "dataset"))
+        export_frame(primary_df, _frame_dir(tmp_dir, "primary"))
+        try:
+            os.rename(tmp_dir, export_dir)
+        except OSError:
+            # Another worker finished its export first
+            shutil.rmtree(tmp_dir)
+        _remove_stale_exports(path, key)
+
+    return (
+        attach_frame(_frame_dir(export_dir, "dataset")),
+        attach_frame(_frame_dir(export_dir, "primary"))
+    )
+
+def _remove_stale_exports(path, key) -> None:
+    for fname in os.listdir(path):
+        if fname != key and not fname.endswith(".tmp"):
+            shutil.rmtree(os.path.join(path, fname), ignore_errors=True)
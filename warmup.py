@@ -0,0 +1,134 @@
+# Purpose: render the likeliest figures in the background at server startup
+#
+# Jobs run in priority order on daemon threads, so the server accepts
+# requests from the start and a figure a user asks for before its turn is
+# simply built by that request instead. Building a figure holds the GIL, so
+# the warm-up runs alongside the requests rather than in parallel with them:
+# more than a thread or two only slows the requests down.
+
+import itertools
+import queue
+import threading
+import time
+
+import plot_computations as pc
+import rollups as ro
+
+DEFAULT_WORKERS = 1
+
+def figure_jobs(df, primary_df, years, default_year) -> list:
+    """Return (priority, build, args) for every figure the dashboard shows
+
+    The figures of the default view come first, then the rest of the main
+    plots, then the other years from the nearest to default_year.
+    """
+    # The state history panel opens on the first state
+    default_state = ro.consumption_rollup(primary_df).state_totals.states[0]
+    jobs = [
+        (0, pc.precompute_main_plots, (df, primary_df, pc.MAIN_DEPICTIONS[0], pc.X_AXIS_TYPES[0])),
+        (0, pc.us_primary_per_year, (primary_df, default_year)),
+        (0, pc.pie_plot_per_year, (primary_df, default_year)),
+        (0, pc.precompute_state_per_year, (df, primary_df, pc.STATE_DEPICTIONS[0], default_year)),
+        (0, pc.state_history, (df, primary_df, default_state, pc.HISTORY_DEPICTIONS[0],
+                               pc.X_AXIS_TYPES[0])),
+    ]
+    for depiction in pc.MAIN_DEPICTIONS:
+        for x_axis in pc.X_AXIS_TYPES:
+            if (depiction, x_axis) != (pc.MAIN_DEPICTIONS[0], pc.X_AXIS_TYPES[0]):
+                jobs.append((1, pc.precompute_main_plots, (df, primary_df, depiction, x_axis)))
+    for depiction in pc.STATE_DEPICTIONS[1:]:
+        jobs.append((1, pc.precompute_state_per_year, (df, primary_df, depiction, default_year)))
+
+    for year in years:
+        if year == default_year:
+            continue
+        priority = 2 + abs(year - default_year)
+        jobs.append((priority, pc.us_primary_per_year, (primary_df, year)))
+        jobs.append((priority, pc.pie_plot_per_year, (primary_df, year)))
+        for depiction in pc.STATE_DEPICTIONS:
+            jobs.append((priority, pc.precompute_state_per_year, (df, primary_df, depiction, year)))
+    return jobs
+
+class Warmup:
+    """Run render(build, *args) for each job on background threads"""
+
+    def __init__(self, jobs, render, workers=DEFAULT_WORKERS):
+        self.render = render
+        self.workers = workers
+        self.total = 0
+        self.done = 0
+        self.failed = 0
+        self.started = None
+        self.finished = None
+        self.stopped = False
+        self._timings = {}
+        self._queue = queue.PriorityQueue()
+        self._lock = threading.Lock()
+        # The counter keeps jobs of equal priority in order
+        order = itertools.count()
+        for priority, build, args in jobs:
+            self._queue.put((priority, next(order), build, args))
+            self.total += 1
+
+    def start(self) -> "Warmup":
+        self.started = time.perf_counter()
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f"warmup-{i}", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        """Drop the jobs that have not started yet
+
+        The run finishes once the jobs already running are done.
+        """
+        dropped = 0
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+            dropped += 1
+        with self._lock:
+            self.total -= dropped
+            self.stopped = True
+            if self.done == self.total and self.finished is None:
+                self.finished = time.perf_counter()
+
+    def _work(self) -> None:
+        while True:
+            try:
+                priority, _, build, args = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            start = time.perf_counter()
+            try:
+                self.render(build, *args)
+                failed = False
+            except Exception:
+                failed = True
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.done += 1
+                self.failed += failed
+                timing = self._timings.setdefault(build.__name__, [0, 0.0])
+                timing[0] += 1
+                timing[1] += elapsed
+                if self.done == self.total:
+                    self.finished = time.perf_counter()
+
+    def progress(self) -> dict:
+        with self._lock:
+            now = self.finished or time.perf_counter()
+            return {
+                "total": self.total,
+                "done": self.done,
+                "failed": self.failed,
+                "workers": self.workers,
+                "complete": self.done == self.total,
+                "stopped": self.stopped,
+                "elapsed_seconds": round(now - self.started, 3) if self.started else None,
+                "seconds_by_builder": {
+                    name: {"count": count, "seconds": round(seconds, 3)}
+                    for name, (count, seconds) in self._timings.items()
+                },
+            }